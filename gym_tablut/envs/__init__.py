@@ -1 +1,10 @@
-from gym_tablut.envs.tablut_env import TablutEnv
\ No newline at end of file
+from gym_tablut.envs.tablut_env import TablutEnv
+from gym_tablut.envs._fast_engine import playout
+from gym_tablut.envs._features import extract_features
+from gym_tablut.envs._cache import MoveCache
+from gym_tablut.envs._positions import PositionPool, save_positions
+from gym_tablut.envs._tournament import Tournament, register_policy
+from gym_tablut.envs._replay import ReplayBuffer
+from gym_tablut.envs._search import ParallelSearch
+from gym_tablut.envs._tablebase import Tablebase, build_tablebase
+from gym_tablut.envs._records import format_record, read_records, replay_record, tensorize, load_shard
\ No newline at end of file
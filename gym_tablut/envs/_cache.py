@@ -0,0 +1,157 @@
+import sys
+from collections import OrderedDict
+
+from gym_tablut.envs._fast_engine import *
+
+# indexes of a cache entry
+_MOVES = 0
+_ACTIONS = 1
+_CAPTURES = 2
+
+
+class MoveCache:
+    def __init__(self, max_positions: int = 100000):
+        """
+        Create a bounded cache of legal moves and capture outcomes.
+
+        Entries are keyed by the encoded board and the player to move, and the least recently used ones are evicted
+        once more than `max_positions` positions are stored. Cached lists are shared: don't modify them.
+
+        :param max_positions: The maximum number of positions to keep
+        """
+        assert max_positions > 0, f"[ERR: MoveCache] Invalid cache size: {max_positions}"
+        self.max_positions = max_positions
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # captures are looked up in positions whose legal moves were just computed, so they are counted on their own
+        self.capture_hits = 0
+        self.capture_misses = 0
+        self.evictions = 0
+        self.memory = 0
+
+    def _entry(self, cells: Sequence[int], player: int, count: bool = True) -> list:
+        """
+        Get the entry of the position, computing its legal moves if it isn't cached
+
+        :param cells: The encoded board
+        :param player: The player to move
+        :param count: If True, the lookup is counted in the hits and misses
+        :return: The entry
+        """
+        key = bytes(cells) + bytes([player])
+        entry = self.entries.get(key)
+        if entry is not None:
+            if count:
+                self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+        if count:
+            self.misses += 1
+        # the moves are the tuples of `MOVES`, shared by all entries, so the cache keeps few objects for the garbage
+        # collector to scan
+        moves = tuple(compact_legal_moves(cells, player))
+        entry = [moves, None, {}]
+        self.entries[key] = entry
+        self.memory += self._entry_size(key, entry)
+        if len(self.entries) > self.max_positions:
+            old_key, old_entry = self.entries.popitem(last=False)
+            self.evictions += 1
+            self.memory -= self._entry_size(old_key, old_entry)
+        return entry
+
+    @staticmethod
+    def _entry_size(key: bytes, entry: list) -> int:
+        """
+        Estimate the memory used by an entry
+
+        :param key: The entry's key
+        :param entry: The entry
+        :return: The estimated size in bytes
+        """
+        moves, actions, captures = entry
+        size = sys.getsizeof(key) + sys.getsizeof(moves)
+        if actions is not None:
+            size += actions.nbytes
+        for captured in captures.values():
+            size += sys.getsizeof(captured)
+        return size
+
+    def legal_moves(self, cells: Sequence[int], player: int) -> Tuple[Tuple[int, int], ...]:
+        """
+        Get the legal moves of the player, as `compact_legal_moves`
+
+        :param cells: The encoded board
+        :param player: The player to move
+        :return: A tuple of moves as (`from_square`, `to_square`)
+        """
+        return self._entry(cells, player)[_MOVES]
+
+    def actions(self, cells: Sequence[int], player: int) -> np.ndarray:
+        """
+        Get the legal moves of the player, as `legal_moves`
+
+        :param cells: The encoded board
+        :param player: The player to move
+        :return: A numpy array of moves in string format `from`-`to`
+        """
+        entry = self._entry(cells, player)
+        if entry[_ACTIONS] is None:
+            entry[_ACTIONS] = np.array([move_to_str(m) for m in entry[_MOVES]])
+            self.memory += entry[_ACTIONS].nbytes
+        return entry[_ACTIONS]
+
+    def captures(self, cells: Sequence[int], player: int, move: Tuple[int, int]) -> List[int]:
+        """
+        Get the squares the move would capture, as `compact_process_captures` after the move
+
+        :param cells: The encoded board, before the move
+        :param player: The player to move
+        :param move: The move as (`from_square`, `to_square`)
+        :return: The list of captured squares
+        """
+        captures = self._entry(cells, player, count=False)[_CAPTURES]
+        captured = captures.get(move)
+        if captured is not None:
+            self.capture_hits += 1
+        else:
+            self.capture_misses += 1
+            p_from, p_to = move
+            after = bytearray(cells)
+            after[p_to], after[p_from] = after[p_from], EMPTY
+            # an escaping king captures nothing
+            if after[p_to] == KING_PIECE and EDGE[p_to]:
+                captured = []
+            else:
+                captured = compact_process_captures(after, p_to)
+            captures[move] = captured
+            self.memory += sys.getsizeof(captured)
+        return captured
+
+    def clear(self):
+        """
+        Empty the cache, keeping the counters
+        """
+        self.entries.clear()
+        self.memory = 0
+
+    def stats(self) -> dict:
+        """
+        Report the cache counters
+
+        :return: A dictionary with hits, misses and hit rate of legal moves and of captures, evictions, stored positions
+        and estimated memory in bytes
+        """
+        lookups = self.hits + self.misses
+        capture_lookups = self.capture_hits + self.capture_misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups > 0 else 0.,
+            'capture_hits': self.capture_hits,
+            'capture_misses': self.capture_misses,
+            'capture_hit_rate': self.capture_hits / capture_lookups if capture_lookups > 0 else 0.,
+            'evictions': self.evictions,
+            'positions': len(self.entries),
+            'memory': self.memory
+        }
@@ -0,0 +1,419 @@
+import random
+from collections import Counter
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+from gym_tablut.envs._utils import *
+
+# compact piece codes (same values as the non-RGB observation)
+EMPTY = 0
+ATK_PIECE = STATE_REP.get(ATTACKER).get(False)
+DEF_PIECE = STATE_REP.get(DEFENDER).get(False)
+KING_PIECE = STATE_REP.get(KING).get(False)
+
+PIECE_TYPES = {
+    ATK_PIECE: ATTACKER,
+    DEF_PIECE: DEFENDER,
+    KING_PIECE: KING
+}
+
+N_SQUARES = N_ROWS * N_COLS
+THRONE = (N_ROWS // 2) * N_COLS + N_COLS // 2
+
+# move outcomes
+ONGOING = 0
+ESCAPED = 1
+KING_CAPTURED = 2
+
+# directions, in the same order used by the game engine: up, right, down, left
+DIRECTIONS = [(-1, 0), (0, 1), (1, 0), (0, -1)]
+
+
+def _make_rays() -> List[List[List[int]]]:
+    """
+    Precompute, for each square, the squares met walking in each direction until the edge of the board
+
+    :return: A list (indexed by square) of four rays (indexed by direction)
+    """
+    rays = []
+    for sq in range(N_SQUARES):
+        i, j = divmod(sq, N_COLS)
+        sq_rays = []
+        for inc_row, inc_col in DIRECTIONS:
+            ray = []
+            r, c = i + inc_row, j + inc_col
+            while 0 <= r < N_ROWS and 0 <= c < N_COLS:
+                ray.append(r * N_COLS + c)
+                r += inc_row
+                c += inc_col
+            sq_rays.append(ray)
+        rays.append(sq_rays)
+    return rays
+
+
+RAYS = _make_rays()
+EDGE = [i == 0 or j == 0 or i == N_ROWS - 1 or j == N_COLS - 1
+        for i, j in (divmod(sq, N_COLS) for sq in range(N_SQUARES))]
+NEXT_TO_THRONE = [any(THRONE in ray[:1] for ray in RAYS[sq]) for sq in range(N_SQUARES)]
+
+
+# moves along each ray, created once and shared by every list of legal moves
+RAY_MOVES = [[[(sq, to) for to in ray] for ray in RAYS[sq]] for sq in range(N_SQUARES)]
+# fixed indexing of all orthogonal moves on the board, independent of the position
+MOVES = [move for sq in range(N_SQUARES) for ray in RAY_MOVES[sq] for move in ray]
+MOVE_INDEX = {move: idx for idx, move in enumerate(MOVES)}
+N_MOVES = len(MOVES)
+
+
+def start_cells() -> bytearray:
+    """
+    Encode the standard Tablut configuration, as placed by `fill_board`
+
+    :return: The encoded board
+    """
+    cells = bytearray(N_SQUARES)
+    for _type, positions in STARTING_LAYOUT.items():
+        for i, j in positions:
+            cells[i * N_COLS + j] = STATE_REP.get(_type).get(False)
+    return cells
+
+
+def encode_board(board: Board) -> bytearray:
+    """
+    Encode the board as a flat, compact array of piece codes
+
+    :param board: The board
+    :return: The encoded board, one byte per square in row-major order
+    """
+    cells = bytearray(N_SQUARES)
+    for i in range(board.rows):
+        for j in range(board.cols):
+            p = board.state[i, j]
+            if p is not None:
+                cells[i * board.cols + j] = STATE_REP.get(p.type).get(False)
+    return cells
+
+
+def cells_as_state(cells: Sequence[int], render_state: bool = False) -> np.ndarray:
+    """
+    Convert the encoded board to an observation state, as `Board.as_state` would
+
+    :param cells: The encoded board
+    :param render_state: If True, converts to a RGB matrix
+    :return: A matrix of values
+    """
+    state = np.frombuffer(bytes(cells), dtype=np.uint8).reshape(N_ROWS, N_COLS)
+    if render_state:
+        colors = np.zeros((KING_PIECE + 1, 3))
+        for code, _type in PIECE_TYPES.items():
+            colors[code] = STATE_REP.get(_type).get(True)
+        return colors[state]
+    return state.astype(np.float64)
+
+
+def square_to_str(sq: int) -> str:
+    """
+    Transform a square index in the board position string (e.g. `e5`)
+
+    :param sq: The square index
+    :return: A string representation of the position
+    """
+    i, j = divmod(sq, N_COLS)
+    return chr(ord('a') + j) + str(N_ROWS - i)
+
+
+def str_to_square(pos: str) -> int:
+    """
+    Transform a board position string (e.g. `e5`) in the square index
+
+    :param pos: The position in string format
+    :return: The square index
+    """
+    return (N_ROWS - int(pos[1:])) * N_COLS + ord(pos[0].lower()) - ord('a')
+
+
+def move_to_str(move: Tuple[int, int]) -> str:
+    """
+    Transform a compact move in the `from`-`to` string format used by the environment
+
+    :param move: The move as (`from_square`, `to_square`)
+    :return: The move in string format
+    """
+    return square_to_str(move[0]) + '-' + square_to_str(move[1])
+
+
+def str_to_move(move: str) -> Tuple[int, int]:
+    """
+    Transform a move in the `from`-`to` string format in a compact move
+
+    :param move: The move in string format
+    :return: The move as (`from_square`, `to_square`)
+    """
+    p_from, p_to = move.split('-')
+    return str_to_square(p_from), str_to_square(p_to)
+
+
+def compact_legal_moves(cells: Sequence[int], player: int) -> List[Tuple[int, int]]:
+    """
+    Compute the legal moves for the player on the encoded board.
+
+    Moves are generated in the same order as `legal_moves`, so the index of a move is also its action.
+
+    :param cells: The encoded board
+    :param player: The player (either ATK or DEF)
+    :return: A list of moves as (`from_square`, `to_square`)
+    """
+    assert player in [ATK, DEF], f"[ERR: compact_legal_moves] Unrecognized player type: {player}"
+    moves = []
+    for sq in range(N_SQUARES):
+        p = cells[sq]
+        if p == EMPTY or (p == ATK_PIECE) != (player == ATK):
+            continue
+        for ray in RAY_MOVES[sq]:
+            for move in ray:
+                to = move[1]
+                if cells[to] != EMPTY:
+                    break
+                # only king can land on throne
+                if to == THRONE and p != KING_PIECE:
+                    continue
+                moves.append(move)
+    return moves
+
+
+def legal_mask(cells: Sequence[int], player: int) -> np.ndarray:
+    """
+    Compute the mask of the legal moves for the player, over the fixed move indexing `MOVES`
+
+    :param cells: The encoded board
+    :param player: The player (either ATK or DEF)
+    :return: A boolean array with one entry per move index
+    """
+    mask = np.zeros(N_MOVES, dtype=bool)
+    mask[[MOVE_INDEX.get(m) for m in compact_legal_moves(cells, player)]] = True
+    return mask
+
+
+def compact_process_captures(cells: Sequence[int], sq: int) -> List[int]:
+    """
+    Find all pieces the piece in `sq` can capture, following the same rules as `process_captures`
+
+    :param cells: The encoded board
+    :param sq: The square of the moved piece
+    :return: The list of captured squares
+    """
+    captures = []
+    piece = cells[sq]
+    for ray in RAYS[sq]:
+        if not ray:
+            continue
+        middle_sq = ray[0]
+        middle = cells[middle_sq]
+        if middle == EMPTY:
+            continue
+        if (piece != ATK_PIECE and middle == ATK_PIECE) or (piece == ATK_PIECE and middle == DEF_PIECE):
+            if len(ray) > 1:
+                outer_sq = ray[1]
+                outer = cells[outer_sq]
+                # normal capture
+                if outer != EMPTY and (piece == outer or (piece != ATK_PIECE and outer != ATK_PIECE)):
+                    captures.append(middle_sq)
+                # capture next to throne
+                elif outer == EMPTY and outer_sq == THRONE and piece == ATK_PIECE:
+                    captures.append(middle_sq)
+        # capture king
+        elif piece == ATK_PIECE and middle == KING_PIECE:
+            # case 1: king is on the throne, need 4 pieces
+            # case 2: king is next to the throne, need 3 pieces
+            if middle_sq == THRONE or NEXT_TO_THRONE[middle_sq]:
+                if compact_check_king(cells, middle_sq) == 4:
+                    captures.append(middle_sq)
+            # case 3: king is free roaming
+            elif len(ray) > 1 and cells[ray[1]] == ATK_PIECE:
+                captures.append(middle_sq)
+    return captures
+
+
+def compact_check_king(cells: Sequence[int], king_sq: int) -> int:
+    """
+    Check king's surrounding tiles for threats, as `_check_king` does
+
+    :param cells: The encoded board
+    :param king_sq: The king's square
+    :return: The number of threatening tiles
+    """
+    threats = 0
+    for ray in RAYS[king_sq]:
+        if ray:
+            p = cells[ray[0]]
+            threats += 1 if p == ATK_PIECE or (p == EMPTY and ray[0] == THRONE) else 0
+    return threats
+
+
+def compact_apply_move(cells: bytearray, move: Tuple[int, int],
+                       captured: Optional[List[int]] = None) -> Tuple[int, List[int], int]:
+    """
+    Apply the move on the encoded board in place, processing also captures
+
+    :param cells: The encoded board
+    :param move: The move as (`from_square`, `to_square`)
+    :param captured: The squares the move captures, if already known
+    :return: The reward, the list of captured squares and the outcome (ONGOING, ESCAPED or KING_CAPTURED)
+    """
+    p_from, p_to = move
+    piece = cells[p_from]
+    assert piece != EMPTY, "[ERR: compact_apply_move] Moved piece is None"
+    assert cells[p_to] == EMPTY, "[Err: compact_apply_move] Destination tile is not empty"
+    cells[p_from] = EMPTY
+    cells[p_to] = piece
+    # check if king has escaped
+    if piece == KING_PIECE and EDGE[p_to]:
+        return CAPTURE_REWARDS.get(KING), [], ESCAPED
+    if captured is None:
+        captured = compact_process_captures(cells, p_to)
+    reward = 0
+    outcome = ONGOING
+    for sq in captured:
+        reward += CAPTURE_REWARDS.get(PIECE_TYPES.get(cells[sq]))
+        if cells[sq] == KING_PIECE:
+            outcome = KING_CAPTURED
+        cells[sq] = EMPTY
+    return reward, captured, outcome
+
+
+def find_king(cells: Sequence[int]) -> Optional[int]:
+    """
+    Find the king on the encoded board
+
+    :param cells: The encoded board
+    :return: The king's square, or None if the king is not on the board
+    """
+    for sq in range(N_SQUARES):
+        if cells[sq] == KING_PIECE:
+            return sq
+    return None
+
+
+def compact_threefold_repetition(last_moves: List[Tuple[int, int]], last_move: Tuple[int, int]) -> bool:
+    """
+    Check for the threefold repetition rule on compact moves, as `check_threefold_repetition` does
+
+    :param last_moves: The latest moves, kept as in `TablutEnv.step`
+    :param last_move: The last move that has been played
+    :return: True if the threefold repetition rule is satisfied, False otherwise
+    """
+    if len(last_moves) < 8:
+        return False
+    else:
+        return ((last_move == last_moves[4]) and
+                (last_move[1] == last_moves[0][1]) and
+                last_moves[7] == last_moves[3] and
+                last_moves[6] == last_moves[2] and
+                last_moves[5] == last_moves[1])
+
+
+def compact_step(cells: bytearray, player: int, history: List[Tuple[int, int]], n_moves: int, move: Tuple[int, int],
+                 cache=None) -> Tuple[Optional[str], Optional[str], Sequence[Tuple[int, int]]]:
+    """
+    Play the move on the encoded board and check if the match is over, with the same rules as `TablutEnv.step`.
+
+    The board and the history of moves are updated in place.
+
+    :param cells: The encoded board
+    :param player: The player moving
+    :param history: The latest moves, kept as in `TablutEnv.step`
+    :param n_moves: The number of moves played before this one
+    :param move: The move as (`from_square`, `to_square`)
+    :param cache: An optional `MoveCache` for legal moves and captures
+    :return: The winner (`ATK`, `DEF` or None), the reason the match ended (None if it goes on) and the legal moves
+    of the opponent
+    """
+    captured = None if cache is None else cache.captures(cells, player, move)
+    _, _, outcome = compact_apply_move(cells, move, captured)
+    if outcome != ONGOING:
+        return ('DEF', ESCAPED_REASON, []) if outcome == ESCAPED else ('ATK', CAPTURED_REASON, [])
+    elif compact_threefold_repetition(history, move):
+        return None, REPETITION_REASON, []
+    elif n_moves == MAX_MOVES:
+        return None, MAX_MOVES_REASON, []
+    if len(history) == 8:
+        history.pop()
+    history.append(move)
+    opponent = ATK if player == DEF else DEF
+    moves = compact_legal_moves(cells, opponent) if cache is None else cache.legal_moves(cells, opponent)
+    if len(moves) == 0:
+        return ('ATK' if opponent == DEF else 'DEF'), NO_MOVES_REASON, moves
+    return None, None, moves
+
+
+def random_policy(cells: bytearray, player: int, moves: List[Tuple[int, int]], rng: random.Random) -> int:
+    """
+    Pick a move uniformly at random
+
+    :param cells: The encoded board
+    :param player: The player to move
+    :param moves: The legal moves
+    :param rng: The random number generator
+    :return: The index of the chosen move
+    """
+    return rng.randrange(len(moves))
+
+
+PLAYOUT_POLICIES = {
+    'random': random_policy
+}
+
+
+def playout(state: Union[Board, Sequence[int]], player: int, policy: Union[str, Callable] = 'random', n: int = 1,
+            last_moves: Optional[List[str]] = None, n_moves: int = 0, seed: Optional[int] = None,
+            cache=None) -> dict:
+    """
+    Play `n` games to completion from the given position.
+
+    The games end with the same rules as `TablutEnv.step`, but are played on the encoded board without building
+    observations or logging.
+
+    :param state: The position, either a `Board` or an encoded board
+    :param player: The player to move
+    :param policy: The policy for both players: either the name of a registered policy or a function `(cells, player,
+    moves, rng)` returning the index of the chosen move
+    :param n: The number of games to play
+    :param last_moves: The latest moves played to reach the position, as `TablutEnv.last_moves`
+    :param n_moves: The number of moves played to reach the position
+    :param seed: The seed of the random number generator
+    :param cache: An optional `MoveCache` for legal moves and captures
+    :return: The outcome statistics: wins per player, draws, counts per reason and the mean number of moves played
+    """
+    assert player in [ATK, DEF], f"[ERR: playout] Unrecognized player type: {player}"
+    if isinstance(policy, str):
+        assert policy in PLAYOUT_POLICIES, f"[ERR: playout] Unrecognized policy: {policy}"
+        policy = PLAYOUT_POLICIES.get(policy)
+    start = encode_board(state) if isinstance(state, Board) else bytes(state)
+    start_moves = [str_to_move(m) for m in last_moves] if last_moves else []
+    rng = random.Random(seed)
+    legal = compact_legal_moves if cache is None else cache.legal_moves
+    stats = {'ATK': 0, 'DEF': 0, 'draws': 0, 'reasons': Counter(), 'moves': 0.}
+    total_moves = 0
+    for _ in range(n):
+        cells = bytearray(start)
+        to_move = player
+        history = list(start_moves)
+        moves_played = n_moves
+        moves = legal(cells, to_move)
+        winner = None
+        reason = None
+        if len(moves) == 0:
+            winner = 'ATK' if to_move == DEF else 'DEF'
+            reason = NO_MOVES_REASON
+        while reason is None:
+            move = moves[policy(cells, to_move, moves, rng)]
+            winner, reason, moves = compact_step(cells, to_move, history, moves_played, move, cache)
+            to_move = ATK if to_move == DEF else DEF
+            moves_played += 1
+        if winner is None:
+            stats['draws'] += 1
+        else:
+            stats[winner] += 1
+        stats.get('reasons')[reason] += 1
+        total_moves += moves_played - n_moves
+    stats['moves'] = total_moves / n if n > 0 else 0.
+    return stats
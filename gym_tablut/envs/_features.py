@@ -0,0 +1,252 @@
+from gym_tablut.envs._fast_engine import *
+
+# king's distance to an edge it cannot reach
+UNREACHABLE = -1
+
+_THRONE_MASK = np.zeros((N_ROWS, N_COLS), dtype=bool)
+_THRONE_MASK[N_ROWS // 2, N_COLS // 2] = True
+_NEXT_TO_THRONE_MASK = np.array(NEXT_TO_THRONE).reshape(N_ROWS, N_COLS)
+_EDGE_MASK = np.array(EDGE).reshape(N_ROWS, N_COLS)
+# edges, in the same order as the directions: top, right, bottom, left
+_EDGES = np.zeros((4, N_ROWS, N_COLS), dtype=bool)
+_EDGES[0, 0, :] = True
+_EDGES[1, :, -1] = True
+_EDGES[2, -1, :] = True
+_EDGES[3, :, 0] = True
+_RGB_CODES = sum(np.array(STATE_REP.get(_type).get(True)) * code for code, _type in PIECE_TYPES.items())
+
+
+def as_batch(boards) -> np.ndarray:
+    """
+    Convert one or more boards to a batch of piece codes
+
+    :param boards: A `Board`, an encoded board, a (rows, cols) matrix of values, a (rows, cols, 3) RGB matrix or a
+    batch of them
+    :return: A (batch, rows, cols) array of piece codes
+    """
+    if isinstance(boards, Board):
+        boards = encode_board(boards)
+    if isinstance(boards, (bytes, bytearray)):
+        boards = np.frombuffer(bytes(boards), dtype=np.uint8)
+    if np.shape(boards)[-1] == 3:
+        # each RGB channel belongs to a single piece type
+        boards = np.asarray(boards) @ _RGB_CODES
+    boards = np.asarray(boards).astype(np.int8, copy=False).reshape(-1, N_ROWS, N_COLS)
+    return boards
+
+
+def _shift(a: np.ndarray, inc_row: int, inc_col: int) -> np.ndarray:
+    """
+    Look at the neighbouring tile in the given trajectory, for every tile at once
+
+    :param a: A (batch, rows, cols) array
+    :param inc_row: Trajectory: 1 for down, -1 for up, 0 for no change
+    :param inc_col: Trajectory: 1 for right, -1 for left, 0 for no change
+    :return: An array with, in each tile, the value of its neighbour (zero outside the board)
+    """
+    out = np.zeros_like(a)
+    r0, r1 = max(0, -inc_row), N_ROWS - max(0, inc_row)
+    c0, c1 = max(0, -inc_col), N_COLS - max(0, inc_col)
+    out[:, r0:r1, c0:c1] = a[:, r0 + inc_row:r1 + inc_row, c0 + inc_col:c1 + inc_col]
+    return out
+
+
+def _reach(pieces: np.ndarray, empty: np.ndarray, on_throne: bool = False) -> np.ndarray:
+    """
+    Find the tiles the pieces can move to with a single move
+
+    :param pieces: A (batch, rows, cols) mask of the moving pieces
+    :param empty: A (batch, rows, cols) mask of the empty tiles
+    :param on_throne: If True, the pieces can land on the throne
+    :return: A (batch, rows, cols) mask of the reachable tiles
+    """
+    reach = np.zeros_like(pieces)
+    for inc_row, inc_col in DIRECTIONS:
+        ray = pieces
+        for _ in range(max(N_ROWS, N_COLS) - 1):
+            ray = _shift(ray, -inc_row, -inc_col) & empty
+            if not ray.any():
+                break
+            reach |= ray
+    if not on_throne:
+        reach &= ~_THRONE_MASK
+    return reach
+
+
+def mobility(boards) -> np.ndarray:
+    """
+    Count the moves available to each piece
+
+    :param boards: The boards (see `as_batch`)
+    :return: A (batch, 2, rows, cols) array with the number of moves of the piece in each tile, indexed by player
+    """
+    boards = as_batch(boards)
+    empty = boards == EMPTY
+    moves = np.zeros((boards.shape[0], N_ROWS, N_COLS), dtype=np.int8)
+    # walk each ray from every tile at once
+    for inc_row, inc_col in DIRECTIONS:
+        free = np.ones_like(empty)
+        ahead = empty
+        throne = _THRONE_MASK[None]
+        for _ in range(max(N_ROWS, N_COLS) - 1):
+            ahead = _shift(ahead, inc_row, inc_col)
+            free = free & ahead
+            if not free.any():
+                break
+            throne = _shift(throne, inc_row, inc_col)
+            # only king can land on throne
+            moves += free & ~(throne & (boards != KING_PIECE))
+    result = np.zeros((boards.shape[0], 2, N_ROWS, N_COLS), dtype=np.int8)
+    result[:, ATK] = np.where(boards == ATK_PIECE, moves, 0)
+    result[:, DEF] = np.where((boards == DEF_PIECE) | (boards == KING_PIECE), moves, 0)
+    return result
+
+
+def escape_lanes(boards) -> np.ndarray:
+    """
+    Find the straight lanes the king can escape through with a single move
+
+    :param boards: The boards (see `as_batch`)
+    :return: A (batch, 4) mask of open lanes, ordered as up, right, down, left
+    """
+    boards = as_batch(boards)
+    king = boards == KING_PIECE
+    empty = boards == EMPTY
+    lanes = np.zeros((boards.shape[0], 4), dtype=bool)
+    for d, (inc_row, inc_col) in enumerate(DIRECTIONS):
+        ray = king
+        for _ in range(max(N_ROWS, N_COLS) - 1):
+            ray = _shift(ray, -inc_row, -inc_col) & empty
+            lanes[:, d] |= (ray & _EDGES[d]).any(axis=(1, 2))
+    return lanes
+
+
+def king_edge_distance(boards) -> np.ndarray:
+    """
+    Compute the least number of moves the king needs to reach each edge, if the other pieces stood still
+
+    :param boards: The boards (see `as_batch`)
+    :return: A (batch, 4) array of distances to the top, right, bottom and left edges, UNREACHABLE if there is no path
+    """
+    boards = as_batch(boards)
+    empty = boards == EMPTY
+    frontier = boards == KING_PIECE
+    visited = frontier.copy()
+    distances = np.full((boards.shape[0], 4), UNREACHABLE, dtype=np.int8)
+    d = 0
+    while frontier.any():
+        d += 1
+        reach = _reach(frontier, empty, on_throne=True) & ~visited
+        for e in range(4):
+            arrived = (reach & _EDGES[e]).any(axis=(1, 2)) & (distances[:, e] == UNREACHABLE)
+            distances[arrived, e] = d
+        visited |= reach
+        # the match is over once the king reaches an edge
+        frontier = reach & ~_EDGE_MASK
+    return distances
+
+
+def king_threats(boards) -> np.ndarray:
+    """
+    Count the threats around the king, as `_check_king` does, and the tiles around it the attackers can still reach
+
+    :param boards: The boards (see `as_batch`)
+    :return: A (batch, 2) array with the number of threatening tiles and of tiles attackers can move into next to
+    the king
+    """
+    boards = as_batch(boards)
+    return _king_threats(boards, _reach(boards == ATK_PIECE, boards == EMPTY))
+
+
+def _king_threats(boards: np.ndarray, atk_reach: np.ndarray) -> np.ndarray:
+    """
+    Count the threats around the king, given the tiles the attackers can reach
+
+    :param boards: A (batch, rows, cols) array of piece codes
+    :param atk_reach: A (batch, rows, cols) mask of the tiles the attackers can reach
+    :return: A (batch, 2) array, as `king_threats`
+    """
+    king = boards == KING_PIECE
+    empty = boards == EMPTY
+    threatening = (boards == ATK_PIECE) | (empty & _THRONE_MASK)
+    threats = np.zeros((boards.shape[0], 2), dtype=np.int8)
+    for inc_row, inc_col in DIRECTIONS:
+        # king's neighbour in this trajectory
+        neighbour = _shift(king, -inc_row, -inc_col)
+        threats[:, 0] += (neighbour & threatening).any(axis=(1, 2))
+        threats[:, 1] += (neighbour & atk_reach).any(axis=(1, 2))
+    return threats
+
+
+def capturable(boards) -> np.ndarray:
+    """
+    Find the pieces the opponent can capture with a single move, following the rules of `process_captures`
+
+    :param boards: The boards (see `as_batch`)
+    :return: A (batch, 2, rows, cols) mask of the capturable pieces, indexed by the player owning them
+    """
+    boards = as_batch(boards)
+    atk_reach = _reach(boards == ATK_PIECE, boards == EMPTY)
+    return _capturable(boards, atk_reach, _king_threats(boards, atk_reach))
+
+
+def _capturable(boards: np.ndarray, atk_reach: np.ndarray, threats: np.ndarray) -> np.ndarray:
+    """
+    Find the capturable pieces, given the tiles the attackers can reach and the threats around the king
+
+    :param boards: A (batch, rows, cols) array of piece codes
+    :param atk_reach: A (batch, rows, cols) mask of the tiles the attackers can reach
+    :param threats: The threats around the king (see `king_threats`)
+    :return: A (batch, 2, rows, cols) mask, as `capturable`
+    """
+    empty = boards == EMPTY
+    atks = boards == ATK_PIECE
+    defs = boards == DEF_PIECE
+    king = boards == KING_PIECE
+    # the king escapes instead of capturing when landing on the edge
+    def_reach = _reach(defs, empty) | (_reach(king, empty, on_throne=True) & ~_EDGE_MASK)
+    # the hammer lands on one side, the anvil stands on the other
+    atk_anvil = atks | (empty & _THRONE_MASK)
+    def_anvil = defs | king
+    free_king = king & ~_THRONE_MASK & ~_NEXT_TO_THRONE_MASK
+    result = np.zeros((boards.shape[0], 2, N_ROWS, N_COLS), dtype=bool)
+    for inc_row, inc_col in DIRECTIONS:
+        hammer_atk = _shift(atk_reach, inc_row, inc_col)
+        hammer_def = _shift(def_reach, inc_row, inc_col)
+        result[:, DEF] |= defs & hammer_atk & _shift(atk_anvil, -inc_row, -inc_col)
+        result[:, DEF] |= free_king & hammer_atk & _shift(atks, -inc_row, -inc_col)
+        result[:, ATK] |= atks & hammer_def & _shift(def_anvil, -inc_row, -inc_col)
+    # on or next to the throne, the king needs to be surrounded on all sides
+    surrounded = (threats[:, 0] == 3) & (threats[:, 1] > 0)
+    result[:, DEF] |= king & ~free_king & surrounded[:, None, None]
+    return result
+
+
+def extract_features(boards) -> dict:
+    """
+    Compute all tactical features for one board or a batch of boards.
+
+    Features are computed with array operations over the whole batch, whose fixed cost dominates for a single board:
+    about 2.5 ms per board one at a time, against 0.05 ms per board in batches of thousands. To shape rewards, collect
+    the boards of many steps or environments and compute their features at once.
+
+    :param boards: The boards (see `as_batch`)
+    :return: A dictionary of features; a single board gives features without the batch dimension
+    """
+    # a single board is a `Board`, an encoded board, a matrix of values or a RGB matrix
+    shape = np.shape(boards) if not isinstance(boards, Board) else ()
+    single = isinstance(boards, (Board, bytes, bytearray)) or len(shape) == 1 or shape == (N_ROWS, N_COLS) or \
+        shape == (N_ROWS, N_COLS, 3)
+    boards = as_batch(boards)
+    atk_reach = _reach(boards == ATK_PIECE, boards == EMPTY)
+    threats = _king_threats(boards, atk_reach)
+    features = {
+        'mobility': mobility(boards),
+        'king_edge_distance': king_edge_distance(boards),
+        'escape_lanes': escape_lanes(boards),
+        'capturable': _capturable(boards, atk_reach, threats),
+        'king_threats': threats
+    }
+    if single:
+        features = {k: v[0] for k, v in features.items()}
+    return features
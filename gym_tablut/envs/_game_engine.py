@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 
 from gym_tablut.envs._utils import *
 
@@ -21,12 +21,14 @@ def update_piece_position(board: Board, piece: Piece, pos: Tuple[str, int]):
                                 (board.rows - i + 1) * SQUARE_HEIGHT + (SQUARE_HEIGHT / 2))
 
 
-def apply_move(board: Board, move: Tuple[Tuple[str, int], Tuple[str, int]]) -> Tuple[int, List[Piece]]:
+def apply_move(board: Board, move: Tuple[Tuple[str, int], Tuple[str, int]],
+               captures: Optional[List[Tuple[int, int]]] = None) -> Tuple[int, List[Piece]]:
     """
     Apply the move, processing also captures
 
     :param board: The board
     :param move: The move
+    :param captures: The array positions of the pieces the move captures, if already known
     :return: The reward and the list of captured pieces
     """
     p_from, p_to = move
@@ -46,7 +48,7 @@ def apply_move(board: Board, move: Tuple[Tuple[str, int], Tuple[str, int]]) -> T
     if moved_piece.type == KING and on_edge_pos(board, moved_piece.position):
         board.king_escaped = True
         return CAPTURE_REWARDS.get(KING), []
-    to_remove = process_captures(board, moved_piece)
+    to_remove = process_captures(board, moved_piece) if captures is None else [board.state[i, j] for i, j in captures]
     reward = 0
     for p in to_remove:
         i, j = pos_to_arr(board, p.position)
@@ -42,6 +42,13 @@ CAPTURE_REWARDS = {
 }
 DRAW_REWARD = 0
 
+# reasons for the end of a match
+ESCAPED_REASON = 'King has escaped'
+CAPTURED_REASON = 'King was captured'
+REPETITION_REASON = 'Threefold repetition'
+MAX_MOVES_REASON = 'Maximum number of moves reached'
+NO_MOVES_REASON = 'No more moves available'
+
 # state representation
 RENDER_STATE = True  # this is the default value, can be changed in the env
 STATE_REP = {
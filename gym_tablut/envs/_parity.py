@@ -0,0 +1,106 @@
+import argparse
+import random
+from collections import Counter
+
+from gym_tablut.envs._cache import MoveCache
+from gym_tablut.envs._fast_engine import *
+from gym_tablut.envs.tablut_env import TablutEnv
+
+
+def _pick_move(moves: Sequence[Tuple[int, int]], played: List[Tuple[int, int]], rng: random.Random,
+               back_and_forth: float) -> int:
+    """
+    Pick a move at random, moving back the piece the player moved last with the given probability, so that
+    repetitions come up
+
+    :param moves: The legal moves
+    :param played: The moves played so far
+    :param rng: The random number generator
+    :param back_and_forth: The probability of moving back the piece the player moved last
+    :return: The index of the chosen move
+    """
+    if len(played) >= 2 and rng.random() < back_and_forth:
+        back = played[-2][1], played[-2][0]
+        if back in moves:
+            return moves.index(back)
+    return rng.randrange(len(moves))
+
+
+def check_parity(n_games: int = 20, seed: int = 0, cache: Optional[MoveCache] = None,
+                 back_and_forth: float = .3) -> dict:
+    """
+    Play random matches on `TablutEnv` and on the encoded board side by side, checking that the compact engine
+    follows the same rules as the environment.
+
+    After every move the actions, the observations, the rewards, the done flags and the info of `TablutEnv.step` are
+    compared with the ones derived from `compact_legal_moves` and `compact_step`. Some matches move pieces back and
+    forth from the start to reach threefold repetitions, and some start close to the maximum number of moves.
+
+    :param n_games: The number of matches to play
+    :param seed: The seed of the random number generator
+    :param cache: An optional `MoveCache` for the environment (the compact engine never uses it)
+    :param back_and_forth: The probability of moving back the piece a player moved last
+    :return: The number of matches and of moves checked and the counts per reason the matches ended
+    """
+    rng = random.Random(seed)
+    env = TablutEnv()
+    env.cache = cache
+    stats = {'games': 0, 'moves': 0, 'reasons': Counter()}
+    for g in range(n_games):
+        env.rgb_state = g % 2 == 0
+        env.reset()
+        # a quarter of the matches moves the pieces back and forth, another quarter is cut short by the maximum number
+        # of moves
+        shuffle = 1. if g % 4 == 2 else back_and_forth
+        if g % 4 == 3:
+            env.n_moves = MAX_MOVES - rng.randrange(20)
+        cells, player, history, n_moves = start_cells(), STARTING_PLAYER, [], env.n_moves
+        moves = compact_legal_moves(cells, player)
+        played = []
+        reason = None
+        while reason is None:
+            assert list(env.actions) == [move_to_str(m) for m in moves], \
+                f"[ERR: check_parity] Different actions in match {g}, move {n_moves}"
+            action = _pick_move(moves, played, rng, shuffle)
+            move = moves[action]
+            before = bytes(cells)
+            obs, rewards, done, info = env.step(action)
+            reward, _, _ = compact_apply_move(bytearray(before), move)
+            winner, reason, moves = compact_step(cells, player, history, n_moves, move)
+            if reason in [REPETITION_REASON, MAX_MOVES_REASON]:
+                reward = DRAW_REWARD
+            elif reason == NO_MOVES_REASON:
+                reward = CAPTURE_REWARDS.get(KING)
+            captured = [square_to_str(sq) for sq in range(N_SQUARES) if before[sq] and not cells[sq] and sq != move[0]]
+            expected = {'captured': sorted(captured), 'winner': winner, 'reason': reason}
+            if reason is not None:
+                expected['n_atks'] = cells.count(ATK_PIECE)
+                expected['n_defs'] = cells.count(DEF_PIECE)
+                if reason != NO_MOVES_REASON:
+                    expected['last_move'] = move_to_str(move)
+            found = {**info, 'captured': sorted(info.get('captured')), 'winner': info.get('winner'),
+                     'reason': info.get('reason')}
+            assert found == expected, \
+                f"[ERR: check_parity] Different info in match {g}, move {n_moves}: {found} != {expected}"
+            assert rewards == reward, \
+                f"[ERR: check_parity] Different rewards in match {g}, move {n_moves}: {rewards} != {reward}"
+            assert done == (reason is not None), f"[ERR: check_parity] Different done in match {g}, move {n_moves}"
+            assert np.array_equal(obs, cells_as_state(cells, env.rgb_state)), \
+                f"[ERR: check_parity] Different observations in match {g}, move {n_moves}"
+            played.append(move)
+            player = ATK if player == DEF else DEF
+            n_moves += 1
+            stats['moves'] += 1
+        stats['games'] += 1
+        stats.get('reasons')[reason] += 1
+    env.close()
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the compact engine against the Tablut environment')
+    parser.add_argument('--games', type=int, default=20, help='The number of matches to play')
+    parser.add_argument('--seed', type=int, default=0, help='The seed of the random number generator')
+    parser.add_argument('--cache', action='store_true', help='Set a MoveCache on the environment')
+    args = parser.parse_args()
+    print(check_parity(args.games, args.seed, MoveCache() if args.cache else None))
@@ -1,4 +1,4 @@
-from typing import Tuple
+from typing import Sequence, Tuple
 
 import numpy as np
 from gym.envs.classic_control import rendering
@@ -63,6 +63,13 @@ class King(Piece):
                          position=position)
 
 
+PIECE_CLASSES = {
+    ATTACKER: Attacker,
+    DEFENDER: Defender,
+    KING: King
+}
+
+
 class Board:
     def __init__(self, n_rows: int, n_cols: int):
         """
@@ -76,6 +83,8 @@ class Board:
         self.state = np.empty((n_rows, n_cols), dtype=Piece)
         self.king_alive = True
         self.king_escaped = False
+        # pieces created by `load`, reused across loads
+        self.pieces = []
 
     def reset(self):
         """
@@ -85,6 +94,31 @@ class Board:
         self.king_alive = True
         self.king_escaped = False
 
+    def load(self, cells: Sequence[int]):
+        """
+        Place the pieces of an encoded board, reusing the pieces of previous loads
+
+        :param cells: The piece codes (as in the non-RGB state), one per tile in row-major order
+        """
+        types = {rep.get(False): _type for _type, rep in STATE_REP.items()}
+        available = {_type: [] for _type in STATE_REP}
+        for p in self.pieces:
+            available.get(p.type).append(p)
+        self.reset()
+        for sq, code in enumerate(cells):
+            if code == 0:
+                continue
+            i, j = divmod(sq, self.cols)
+            position = (chr(ord('a') + j), self.rows - i)
+            _type = types.get(code)
+            if available.get(_type):
+                p = available.get(_type).pop()
+                p.position = position
+            else:
+                p = PIECE_CLASSES.get(_type)(position)
+                self.pieces.append(p)
+            self.state[i, j] = p
+
     def count(self, _type: str) -> int:
         """
         Count how many pieces of type `_type` are on the board
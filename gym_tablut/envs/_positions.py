@@ -0,0 +1,79 @@
+from gym_tablut.envs._fast_engine import *
+
+POSITION_DTYPE = np.dtype([('cells', np.uint8, (N_SQUARES,)),
+                           ('player', np.uint8),
+                           ('n_moves', np.uint16),
+                           ('weight', np.float32)])
+
+
+def save_positions(path: str, cells: np.ndarray, players: np.ndarray, n_moves: Optional[np.ndarray] = None,
+                   weights: Optional[np.ndarray] = None):
+    """
+    Write encoded positions to a file that can be memory-mapped as a `PositionPool`
+
+    :param path: The file path (a `.npy` file)
+    :param cells: A (positions, rows, cols) or (positions, squares) array of piece codes
+    :param players: The player to move in each position
+    :param n_moves: The number of moves played to reach each position (0 by default)
+    :param weights: The sampling weight of each position (1 by default)
+    """
+    cells = np.asarray(cells, dtype=np.uint8).reshape(-1, N_SQUARES)
+    pool = np.lib.format.open_memmap(path, mode='w+', dtype=POSITION_DTYPE, shape=(cells.shape[0],))
+    pool['cells'] = cells
+    pool['player'] = players
+    pool['n_moves'] = 0 if n_moves is None else n_moves
+    pool['weight'] = 1. if weights is None else weights
+    pool.flush()
+
+
+class PositionPool:
+    def __init__(self, path: str, shard: int = 0, n_shards: int = 1, seed: Optional[int] = None):
+        """
+        Open a memory-mapped pool of starting positions.
+
+        Each worker can open its own shard, a contiguous slice of the pool, and samples positions in it proportionally
+        to their weights.
+
+        :param path: The file written by `save_positions`
+        :param shard: The shard to sample from
+        :param n_shards: The number of shards the pool is split into
+        :param seed: The seed of the random number generator
+        """
+        assert 0 <= shard < n_shards, f"[ERR: PositionPool] Invalid shard {shard} of {n_shards}"
+        self.positions = np.load(path, mmap_mode='r')
+        assert self.positions.dtype == POSITION_DTYPE, f"[ERR: PositionPool] Unrecognized pool format: {path}"
+        n = len(self.positions)
+        self.start = n * shard // n_shards
+        self.end = n * (shard + 1) // n_shards
+        assert self.end > self.start, f"[ERR: PositionPool] Shard {shard} of {n_shards} is empty"
+        self.rng = np.random.default_rng(seed)
+        weights = self.positions['weight'][self.start:self.end]
+        assert np.all(weights >= 0), '[ERR: PositionPool] Weights must not be negative'
+        assert weights.sum(dtype=np.float64) > 0, '[ERR: PositionPool] All weights are zero'
+        # uniform pools don't need the cumulative weights
+        self.cumulative = None if np.all(weights == weights[0]) else np.cumsum(weights, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def sample(self) -> Tuple[bytes, int, int]:
+        """
+        Sample a position from the shard
+
+        :return: The encoded board, the player to move and the number of moves played
+        """
+        if self.cumulative is None:
+            idx = self.rng.integers(len(self))
+        else:
+            idx = int(np.searchsorted(self.cumulative, self.rng.random() * self.cumulative[-1], side='right'))
+        return self[min(idx, len(self) - 1)]
+
+    def __getitem__(self, idx: int) -> Tuple[bytes, int, int]:
+        """
+        Get a position of the shard
+
+        :param idx: The index of the position in the shard
+        :return: The encoded board, the player to move and the number of moves played
+        """
+        position = self.positions[self.start + idx]
+        return position['cells'].tobytes(), int(position['player']), int(position['n_moves'])
@@ -0,0 +1,310 @@
+import glob
+import itertools
+import multiprocessing
+import os
+import re
+from typing import Dict, Iterable, Iterator
+
+from gym import logger
+
+from gym_tablut.envs._replay import *
+
+# results of a record: a side won, a draw, or unknown (e.g. an unfinished match)
+RESULTS = {'ATK': 'ATK', 'DEF': 'DEF', 'draw': None, '*': None}
+PLAYERS = {'ATK': ATK, 'DEF': DEF}
+
+_TAG = re.compile(r'^\[(\w+)\s+"(.*)"\]$')
+_MOVE_NUMBER = re.compile(r'^(\d+\.+|\.\.\.)$')
+_MOVE = re.compile(r'^([a-z]\d+)-([a-z]\d+)(?:x([a-z]\d+(?:/[a-z]\d+)*))?$')
+
+
+class InvalidRecord(ValueError):
+    """
+    A game record that can't be parsed or doesn't replay legally
+    """
+    pass
+
+
+def _square(pos: str) -> int:
+    """
+    Transform a board position string in the square index, checking it is on the board
+
+    :param pos: The position in string format
+    :return: The square index
+    """
+    i, j = N_ROWS - int(pos[1:]), ord(pos[0]) - ord('a')
+    if not (0 <= i < N_ROWS and 0 <= j < N_COLS):
+        raise InvalidRecord(f"Position outside of the board: {pos}")
+    return i * N_COLS + j
+
+
+def parse_record(lines: Iterable[str]) -> dict:
+    """
+    Parse a game record: tag pairs (e.g. `[Result "DEF"]`) followed by the numbered list of moves, each in `from`-`to`
+    format with an optional `x` and the `/`-separated captured positions (e.g. `1. e1-e3 e5-c5xc4/b5`)
+
+    :param lines: The lines of the record
+    :return: The tags, the moves in string format and the captures of each move (None if not annotated)
+    """
+    tags, moves, captures = {}, [], []
+    for line in lines:
+        line = line.strip()
+        match = _TAG.match(line)
+        if match is not None:
+            tags[match.group(1)] = match.group(2)
+            continue
+        # comments run from `;` to the end of the line
+        for token in line.split(';')[0].split():
+            if _MOVE_NUMBER.match(token):
+                continue
+            match = _MOVE.match(token)
+            if match is None:
+                raise InvalidRecord(f"Unrecognized token: {token}")
+            moves.append(f"{match.group(1)}-{match.group(2)}")
+            captures.append(None if match.group(3) is None else match.group(3).split('/'))
+    return {'tags': tags, 'moves': moves, 'captures': captures}
+
+
+def _split_records(lines: Iterable[str]) -> Iterator[List[str]]:
+    """
+    Split a stream of lines in the lines of each record: a record ends at a blank line or at a tag line following its
+    moves, and a record without moves ends at a tag line following a blank line
+
+    :param lines: The lines
+    :return: A generator of the lines of each record
+    """
+    record, has_moves, after_blank = [], False, False
+    for line in lines:
+        stripped = line.strip()
+        if not stripped:
+            if has_moves:
+                yield record
+                record, has_moves = [], False
+            after_blank = len(record) > 0
+            continue
+        is_tag = stripped.startswith('[')
+        if is_tag and (has_moves or after_blank):
+            yield record
+            record, has_moves = [], False
+        record.append(stripped)
+        has_moves = has_moves or not is_tag
+        after_blank = False
+    if record:
+        yield record
+
+
+def read_records(path: str) -> Iterator[dict]:
+    """
+    Read the game records of a file, one at a time. Records that can't be parsed are skipped, records without moves
+    are not
+
+    :param path: The file path
+    :return: A generator of parsed records (see `parse_record`)
+    """
+    with open(path) as f:
+        for i, lines in enumerate(_split_records(f)):
+            try:
+                yield parse_record(lines)
+            except InvalidRecord as e:
+                logger.debug(f"Skipped record {i} of {path}: {e}")
+
+
+def replay_record(record: dict) -> dict:
+    """
+    Replay a parsed record on the compact board, checking every move and annotated capture against the rules
+
+    :param record: The parsed record (see `parse_record`)
+    :return: The boards before each move, the players and the indexes of the moves (see `MOVE_INDEX`), the captures
+    of each move, the winner (`ATK`, `DEF` or None) and the reason the match ended (None if it didn't end by the rules)
+    """
+    tags = record.get('tags')
+    if 'Start' in tags:
+        if not re.match(rf'^[0-{KING_PIECE}]{{{N_SQUARES}}}$', tags.get('Start')):
+            raise InvalidRecord(f"Invalid starting position: {tags.get('Start')}")
+        cells = bytearray(int(c) for c in tags.get('Start'))
+    else:
+        cells = start_cells()
+    if tags.get('Player', 'ATK') not in PLAYERS:
+        raise InvalidRecord(f"Invalid player: {tags.get('Player')}")
+    player = PLAYERS.get(tags.get('Player', 'ATK'))
+    if tags.get('Result', '*') not in RESULTS:
+        raise InvalidRecord(f"Invalid result: {tags.get('Result')}")
+    history = []
+    moves = compact_legal_moves(cells, player)
+    replay = {'boards': [], 'players': [], 'moves': [], 'captures': [], 'winner': None, 'reason': None}
+    for n, (move_str, annotated) in enumerate(zip(record.get('moves'), record.get('captures'))):
+        if replay.get('reason') is not None:
+            raise InvalidRecord(f"Move {n + 1} is played after the end of the match")
+        move = _square(move_str[:move_str.index('-')]), _square(move_str[move_str.index('-') + 1:])
+        if move not in moves:
+            raise InvalidRecord(f"Illegal move {n + 1}: {move_str}")
+        before = bytes(cells)
+        replay.get('boards').append(before)
+        replay.get('players').append(player)
+        replay.get('moves').append(MOVE_INDEX.get(move))
+        winner, reason, moves = compact_step(cells, player, history, n, move)
+        captured = [square_to_str(sq) for sq in range(N_SQUARES) if before[sq] and not cells[sq] and sq != move[0]]
+        if annotated is not None and sorted(annotated) != sorted(captured):
+            raise InvalidRecord(f"Wrong captures of move {n + 1}: {move_str}")
+        replay.get('captures').append(captured)
+        replay['winner'], replay['reason'] = winner, reason
+        player = ATK if player == DEF else DEF
+    result = RESULTS.get(tags.get('Result', '*'))
+    if replay.get('reason') is None:
+        # matches can also end by resignation or adjudication
+        replay['winner'] = result
+    elif tags.get('Result', '*') != '*' and result != replay.get('winner'):
+        raise InvalidRecord(f"Wrong result: {tags.get('Result')}")
+    return replay
+
+
+def format_record(moves: List[str], tags: Optional[Dict[str, str]] = None, start: Optional[Sequence[int]] = None,
+                  player: int = STARTING_PLAYER) -> str:
+    """
+    Write a match as a game record, annotating the captures and, if the match ended, its result
+
+    :param moves: The moves played, in string format `from`-`to`
+    :param tags: Additional tags (e.g. the players' names)
+    :param start: The encoded starting board, if not the standard configuration
+    :param player: The player moving first
+    :return: The game record
+    """
+    tags = {'Variant': 'Tablut', **(tags or {})}
+    if start is not None:
+        tags['Start'] = ''.join(str(c) for c in start)
+        tags['Player'] = 'ATK' if player == ATK else 'DEF'
+    replay = replay_record({'tags': tags, 'moves': list(moves), 'captures': [None] * len(moves)})
+    if replay.get('reason') is not None:
+        tags['Result'] = replay.get('winner') or 'draw'
+        tags['Reason'] = replay.get('reason')
+    lines = [f'[{name} "{value}"]' for name, value in tags.items()]
+    lines.append('')
+    tokens = [m + ('x' + '/'.join(c) if c else '') for m, c in zip(moves, replay.get('captures'))]
+    # the defender moving first skips the attacker's move of the first round
+    if player == DEF:
+        tokens.insert(0, '...')
+    for n in range(0, len(tokens), 2):
+        lines.append(f"{n // 2 + 1}. {' '.join(tokens[n:n + 2])}")
+    return '\n'.join(lines) + '\n'
+
+
+def _tensorize_record(job: Tuple[str, int, List[str]]) -> Optional[Tuple[np.ndarray, ...]]:
+    """
+    Convert a game record to training samples, in a worker
+
+    :param job: The file, the index and the lines of the record
+    :return: The packed boards, the players, the move indexes and the outcomes for the player to move, or None if the
+    record is invalid or has no moves
+    """
+    path, i, lines = job
+    try:
+        record = parse_record(lines)
+        if not record.get('moves'):
+            raise InvalidRecord('No moves')
+        replay = replay_record(record)
+    except InvalidRecord as e:
+        logger.debug(f"Skipped record {i} of {path}: {e}")
+        return None
+    players = np.array(replay.get('players'), dtype=np.uint8)
+    winner = replay.get('winner')
+    if winner is None:
+        outcomes = np.zeros(len(players), dtype=np.int8)
+    else:
+        outcomes = np.where(players == PLAYERS.get(winner), 1, -1).astype(np.int8)
+    boards = np.frombuffer(b''.join(replay.get('boards')), dtype=np.uint8).reshape(-1, N_SQUARES)
+    return pack_boards(boards), players, np.array(replay.get('moves'), dtype=np.uint16), outcomes
+
+
+def _jobs(paths: List[str]) -> Iterator[Tuple[str, int, List[str]]]:
+    """
+    Stream the records of the files
+
+    :param paths: The files
+    :return: A generator of the file, the index and the lines of each record
+    """
+    for path in paths:
+        with open(path) as f:
+            for i, lines in enumerate(_split_records(f)):
+                yield path, i, lines
+
+
+def tensorize(paths: Union[str, List[str]], directory: str, shard_size: int = 1 << 20,
+              n_workers: Optional[int] = None, chunksize: int = 64) -> dict:
+    """
+    Convert collections of game records to sharded training datasets.
+
+    Records are streamed from the files and replayed by worker processes; the ones that don't replay legally or have
+    no moves are skipped. Each shard (`shard-00000.npz`, ...) holds up to `shard_size` positions: the boards before each move, packed
+    as in `pack_boards`, the players to move, the move indexes (see `MOVE_INDEX`) and the outcomes for the player to
+    move (1 for a win, -1 for a loss, 0 for a draw or an unknown result). Shards are the same for any number of workers.
+
+    :param paths: The record files, or a glob pattern
+    :param directory: The directory of the shards
+    :param shard_size: The maximum number of positions of a shard
+    :param n_workers: The number of worker processes (by default, one per CPU)
+    :param chunksize: The number of records sent to a worker at once
+    :return: The number of converted and skipped records, of positions and of shards
+    """
+    paths = sorted(glob.glob(paths)) if isinstance(paths, str) else list(paths)
+    n_workers = n_workers or os.cpu_count()
+    os.makedirs(directory, exist_ok=True)
+    stats = {'records': 0, 'skipped': 0, 'positions': 0, 'shards': 0}
+    buffer, buffered = [], 0
+
+    def write_shard(samples: List[Tuple[np.ndarray, ...]]):
+        boards, players, moves, outcomes = (np.concatenate(field) for field in zip(*samples))
+        np.savez(os.path.join(directory, f"shard-{stats.get('shards'):05d}.npz"), boards=boards, players=players,
+                 moves=moves, outcomes=outcomes)
+        stats['shards'] += 1
+
+    pool = multiprocessing.Pool(n_workers) if n_workers > 1 else None
+    try:
+        jobs = _jobs(paths)
+        while True:
+            # a batch at a time, so the records are never all in memory
+            batch = list(itertools.islice(jobs, n_workers * chunksize * 4))
+            if not batch:
+                break
+            results = pool.imap(_tensorize_record, batch, chunksize) if pool else map(_tensorize_record, batch)
+            for samples in results:
+                if samples is None:
+                    stats['skipped'] += 1
+                    continue
+                stats['records'] += 1
+                stats['positions'] += len(samples[0])
+                buffer.append(samples)
+                buffered += len(samples[0])
+                while buffered >= shard_size:
+                    # split the samples filling the shard
+                    rest = buffered - shard_size
+                    last = buffer.pop()
+                    keep = len(last[0]) - rest
+                    buffer.append(tuple(field[:keep] for field in last))
+                    write_shard(buffer)
+                    buffer = [tuple(field[keep:] for field in last)] if rest > 0 else []
+                    buffered = rest
+        if buffered > 0:
+            write_shard(buffer)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return stats
+
+
+def load_shard(path: str, render_state: bool = True, dtype=np.float32) -> dict:
+    """
+    Load a shard written by `tensorize`, decoding the boards to observations
+
+    :param path: The shard file
+    :param render_state: If True, boards are decoded to RGB matrices
+    :param dtype: The type of the observations
+    :return: A dictionary of arrays: the boards, the players, the move indexes and the outcomes
+    """
+    with np.load(path) as shard:
+        return {
+            'boards': decode_planes(shard['boards'], render_state, dtype),
+            'players': shard['players'],
+            'moves': shard['moves'],
+            'outcomes': shard['outcomes']
+        }
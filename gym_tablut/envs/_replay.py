@@ -0,0 +1,263 @@
+import os
+
+from gym_tablut.envs._features import *
+
+# 2 bits per square, 4 squares per byte
+PACKED_SIZE = (N_SQUARES + 3) // 4
+MASK_SIZE = (N_MOVES + 7) // 8
+
+_SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+
+
+def pack_boards(boards) -> np.ndarray:
+    """
+    Pack boards at 2 bits per square
+
+    :param boards: The boards (see `as_batch`)
+    :return: A (batch, PACKED_SIZE) array of bytes
+    """
+    codes = as_batch(boards).reshape(-1, N_SQUARES).astype(np.uint8)
+    padded = np.zeros((codes.shape[0], PACKED_SIZE * 4), dtype=np.uint8)
+    padded[:, :N_SQUARES] = codes
+    return np.bitwise_or.reduce(padded.reshape(-1, PACKED_SIZE, 4) << _SHIFTS, axis=2).astype(np.uint8)
+
+
+def unpack_boards(packed: np.ndarray) -> np.ndarray:
+    """
+    Unpack boards packed by `pack_boards`
+
+    :param packed: A (batch, PACKED_SIZE) array of bytes
+    :return: A (batch, rows, cols) array of piece codes
+    """
+    codes = (packed[:, :, None] >> _SHIFTS) & 3
+    return codes.reshape(-1, PACKED_SIZE * 4)[:, :N_SQUARES].reshape(-1, N_ROWS, N_COLS)
+
+
+def decode_planes(packed: np.ndarray, render_state: bool = True, dtype=np.float32) -> np.ndarray:
+    """
+    Unpack boards to observations, as `Board.as_state` would
+
+    :param packed: A (batch, PACKED_SIZE) array of bytes
+    :param render_state: If True, converts to RGB matrices
+    :param dtype: The type of the observations
+    :return: A (batch, rows, cols, 3) array of RGB matrices, or a (batch, rows, cols) array of values
+    """
+    codes = unpack_boards(packed)
+    if not render_state:
+        return codes.astype(dtype)
+    colors = np.zeros((KING_PIECE + 1, 3), dtype=dtype)
+    for code, _type in PIECE_TYPES.items():
+        colors[code] = STATE_REP.get(_type).get(True)
+    return colors[codes]
+
+
+class SumTree:
+    def __init__(self, capacity: int, path: Optional[str] = None, reopen: bool = False):
+        """
+        Create a binary tree of sums over the priorities of `capacity` items
+
+        :param capacity: The number of items
+        :param path: If given, the `.npy` file of the memory-mapped nodes
+        :param reopen: If True, the nodes stored in the file are kept
+        """
+        self.capacity = capacity
+        self.size = 1
+        while self.size < capacity:
+            self.size *= 2
+        self.nodes = _array(path, np.float64, (2 * self.size,), reopen)
+
+    def total(self) -> float:
+        """
+        Get the sum of all priorities
+
+        :return: The total priority
+        """
+        return self.nodes[1]
+
+    def update(self, indexes: np.ndarray, priorities: np.ndarray):
+        """
+        Set the priorities of the items
+
+        :param indexes: The items' indexes
+        :param priorities: The new priorities
+        """
+        nodes = np.asarray(indexes) + self.size
+        self.nodes[nodes] = priorities
+        nodes = np.unique(nodes // 2)
+        # recompute the parents, one level at a time
+        while nodes[0] > 0:
+            self.nodes[nodes] = self.nodes[2 * nodes] + self.nodes[2 * nodes + 1]
+            nodes = np.unique(nodes // 2)
+
+    def find(self, values: np.ndarray) -> np.ndarray:
+        """
+        Find the items where the cumulative priorities reach the given values
+
+        :param values: Values between 0 and the total priority
+        :return: The items' indexes
+        """
+        nodes = np.ones(len(values), dtype=np.int64)
+        values = np.array(values, dtype=np.float64)
+        while nodes[0] < self.size:
+            left = 2 * nodes
+            # rounding errors must not lead to empty leaves
+            go_right = (values >= self.nodes[left]) & (self.nodes[left + 1] > 0)
+            values -= np.where(go_right, self.nodes[left], 0.)
+            nodes = left + go_right
+        return nodes - self.size
+
+
+def _array(path: Optional[str], dtype, shape: tuple, reopen: bool = False) -> np.ndarray:
+    """
+    Create an array of zeros, either in memory or memory-mapped
+
+    :param path: The `.npy` file, or None for an in-memory array
+    :param dtype: The type of the array
+    :param shape: The shape of the array
+    :param reopen: If True, the file is reopened with its content instead
+    :return: The array
+    """
+    if path is None:
+        return np.zeros(shape, dtype=dtype)
+    if not reopen:
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+    assert os.path.exists(path), f"[ERR: ReplayBuffer] Missing array: {path}"
+    array = np.load(path, mmap_mode='r+')
+    assert array.shape == shape and array.dtype == dtype, f"[ERR: ReplayBuffer] Incompatible array in {path}"
+    return array
+
+
+class ReplayBuffer:
+    def __init__(self, capacity: int, path: Optional[str] = None, prioritized: bool = False, alpha: float = 0.6,
+                 seed: Optional[int] = None):
+        """
+        Create a ring buffer of transitions, with boards packed at 2 bits per square.
+
+        Each transition holds the board, the player to move, the move index (see `MOVES`), the reward, the next board,
+        the done flag and the bitset of the legal moves in the board.
+
+        :param capacity: The maximum number of transitions, the oldest are overwritten first
+        :param path: If given, the directory of the memory-mapped arrays backing the buffer; a buffer already stored
+        there is reopened with its transitions and priorities
+        :param prioritized: If True, transitions are sampled proportionally to their priority
+        :param alpha: The exponent applied to priorities
+        :param seed: The seed of the random number generator
+        """
+        self.capacity = capacity
+        self.prioritized = prioritized
+        self.alpha = alpha
+        self.rng = np.random.default_rng(seed)
+        fields = {
+            'boards': (np.uint8, (capacity, PACKED_SIZE)),
+            'players': (np.uint8, (capacity,)),
+            'actions': (np.uint16, (capacity,)),
+            'rewards': (np.float32, (capacity,)),
+            'next_boards': (np.uint8, (capacity, PACKED_SIZE)),
+            'dones': (bool, (capacity,)),
+            'legal': (np.uint8, (capacity, MASK_SIZE))
+        }
+        files = {name: None if path is None else os.path.join(path, f'{name}.npy')
+                 for name in list(fields) + ['tree', 'state']}
+        # the state is written last, so it marks a complete buffer
+        reopen = path is not None and os.path.exists(files.get('state'))
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            assert not (reopen and prioritized and not os.path.exists(files.get('tree'))), \
+                f"[ERR: ReplayBuffer] The buffer in {path} is not prioritized"
+        for name, (dtype, shape) in fields.items():
+            setattr(self, name, _array(files.get(name), dtype, shape, reopen))
+        self.tree = SumTree(capacity, files.get('tree'), reopen) if prioritized else None
+        # the position of the next transition, the number of transitions and the highest priority
+        self.state = _array(files.get('state'), np.float64, (3,), reopen)
+        if not reopen:
+            self.state[:] = 0, 0, 1.
+        self.pos, self.size, self.max_priority = int(self.state[0]), int(self.state[1]), float(self.state[2])
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, board, player: int, action: int, reward: float, next_board, done: bool,
+            legal: Optional[np.ndarray] = None):
+        """
+        Add a transition, with the highest priority seen so far
+
+        :param board: The board (see `as_batch`)
+        :param player: The player to move
+        :param action: The index of the move played (see `MOVE_INDEX`)
+        :param reward: The reward
+        :param next_board: The board after the move (see `as_batch`)
+        :param done: True if the match ended
+        :param legal: The mask of the legal moves (see `legal_mask`); computed from the board if not given
+        """
+        if legal is None:
+            legal = legal_mask(bytes(as_batch(board)[0].reshape(-1).astype(np.uint8)), player)
+        i = self.pos
+        self.boards[i] = pack_boards(board)[0]
+        self.players[i] = player
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_boards[i] = pack_boards(next_board)[0]
+        self.dones[i] = done
+        self.legal[i] = np.packbits(legal)
+        if self.tree is not None:
+            self.tree.update(np.array([i]), np.array([self.max_priority ** self.alpha]))
+        self.pos = (self.pos + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.state[:] = self.pos, self.size, self.max_priority
+
+    def sample(self, batch_size: int, beta: float = 0.4, render_state: bool = True) -> dict:
+        """
+        Sample a batch of transitions, decoding boards and legal moves
+
+        :param batch_size: The number of transitions
+        :param beta: The exponent of the importance sampling weights, for prioritized buffers
+        :param render_state: If True, boards are decoded to RGB matrices
+        :return: A dictionary of arrays: the sampled indexes, the importance sampling weights (all ones if not
+        prioritized) and the transitions' fields
+        """
+        assert self.size > 0, '[ERR: ReplayBuffer] The buffer is empty'
+        if self.tree is None:
+            indexes = self.rng.integers(self.size, size=batch_size)
+            weights = np.ones(batch_size, dtype=np.float32)
+        else:
+            total = self.tree.total()
+            # stratified sampling over the cumulative priorities
+            values = (np.arange(batch_size) + self.rng.random(batch_size)) * total / batch_size
+            indexes = self.tree.find(values)
+            probabilities = self.tree.nodes[indexes + self.tree.size] / total
+            weights = (self.size * probabilities) ** -beta
+            weights = (weights / weights.max()).astype(np.float32)
+        return {
+            'indexes': indexes,
+            'weights': weights,
+            'boards': decode_planes(self.boards[indexes], render_state),
+            'players': self.players[indexes],
+            'actions': self.actions[indexes],
+            'rewards': self.rewards[indexes],
+            'next_boards': decode_planes(self.next_boards[indexes], render_state),
+            'dones': self.dones[indexes],
+            'legal': np.unpackbits(self.legal[indexes], axis=1, count=N_MOVES).astype(bool)
+        }
+
+    def update_priorities(self, indexes: np.ndarray, priorities: np.ndarray):
+        """
+        Update the priorities of sampled transitions, e.g. with their TD errors
+
+        :param indexes: The indexes returned by `sample`
+        :param priorities: The new priorities
+        """
+        assert self.tree is not None, '[ERR: ReplayBuffer] The buffer is not prioritized'
+        priorities = np.asarray(priorities, dtype=np.float64)
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(indexes, priorities ** self.alpha)
+        self.state[2] = self.max_priority
+
+    def flush(self):
+        """
+        Write the memory-mapped arrays to disk
+        """
+        arrays = [self.boards, self.players, self.actions, self.rewards, self.next_boards, self.dones, self.legal,
+                  self.state] + ([self.tree.nodes] if self.tree is not None else [])
+        for array in arrays:
+            if isinstance(array, np.memmap):
+                array.flush()
@@ -0,0 +1,255 @@
+import math
+import multiprocessing
+import os
+import random
+import time
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+from gym_tablut.envs._fast_engine import *
+from gym_tablut.envs.tablut_env import TablutEnv
+
+# a search state: the encoded board, the player to move, the latest moves (as in `TablutEnv.last_moves`) and the number
+# of moves played; it pickles to about a hundred bytes
+SearchState = Tuple[bytes, int, Tuple[Tuple[int, int], ...], int]
+
+# scores of a match, from the point of view of a player
+_SCORES = {True: 1., None: 0.5, False: 0.}
+# time (in seconds) kept from the budget of a parallel search for dispatching the jobs, the last rollout and merging
+SEARCH_MARGIN = 0.05
+
+
+def search_state(env: TablutEnv) -> SearchState:
+    """
+    Encode the current position of the environment for the search
+
+    :param env: The environment
+    :return: The search state
+    """
+    return (bytes(encode_board(env.board)), env.player, tuple(str_to_move(m) for m in env.last_moves), env.n_moves)
+
+
+class _Node:
+    __slots__ = ['moves', 'children', 'visits', 'wins', 'expanded', 'winner', 'over', 'winning']
+
+    def __init__(self, moves: Sequence[Tuple[int, int]], winner: Optional[str] = None, over: bool = False):
+        """
+        Create a search tree node
+
+        :param moves: The legal moves in the node
+        :param winner: The winner, if the match is over
+        :param over: True if the match is over
+        """
+        self.moves = moves
+        self.children = [None] * len(moves)
+        # statistics of the children, from the point of view of the player moving in this node
+        self.visits = [0] * len(moves)
+        self.wins = [0.] * len(moves)
+        self.expanded = 0
+        self.winner = winner
+        self.over = over
+        # a move ending the match with a win for the player moving in this node
+        self.winning = None
+
+
+def _score(winner: Optional[str], player: int) -> float:
+    """
+    Score the match for the player
+
+    :param winner: The winner (`ATK`, `DEF` or None for a draw)
+    :param player: The player
+    :return: 1 for a win, 0.5 for a draw, 0 for a loss
+    """
+    return _SCORES.get(None if winner is None else (winner == 'ATK') == (player == ATK))
+
+
+def mcts(state: SearchState, iterations: Optional[int] = None, deadline: Optional[float] = None,
+         root_moves: Optional[List[int]] = None, seed: int = 0, c: float = 1.4) -> Tuple[List[int], List[float]]:
+    """
+    Run a UCT search with random rollouts on the compact board
+
+    :param state: The search state
+    :param iterations: The number of simulations
+    :param deadline: The time (as `time.time()`) by which the search stops
+    :param root_moves: The indexes of the legal moves to search at the root (all by default)
+    :param seed: The seed of the random number generator
+    :param c: The exploration constant
+    :return: The visits and wins of each searched root move
+    """
+    assert iterations is not None or deadline is not None, '[ERR: mcts] The search needs a budget'
+    cells, player, history, n_moves = state
+    rng = random.Random(seed)
+    moves = compact_legal_moves(cells, player)
+    if root_moves is not None:
+        moves = [moves[i] for i in root_moves]
+    assert len(moves) > 0, '[ERR: mcts] No moves to search'
+    root = _Node(moves)
+    done = 0
+    while (iterations is None or done < iterations) and (deadline is None or time.time() < deadline):
+        done += 1
+        board = bytearray(cells)
+        last_moves = list(history)
+        to_move = player
+        played = n_moves
+        node = root
+        path = []
+        while True:
+            if node.over:
+                winner = node.winner
+                break
+            if node.winning is not None:
+                i = node.winning
+            elif node.expanded < len(node.moves):
+                i = node.expanded
+                node.expanded += 1
+            else:
+                log_n = math.log(sum(node.visits))
+                i = max(range(len(node.moves)),
+                        key=lambda k: node.wins[k] / node.visits[k] + c * math.sqrt(log_n / node.visits[k]))
+            winner, reason, child_moves = compact_step(board, to_move, last_moves, played, node.moves[i])
+            path.append((node, i, to_move))
+            to_move = ATK if to_move == DEF else DEF
+            played += 1
+            if node.children[i] is None:
+                node.children[i] = _Node(child_moves, winner, reason is not None)
+                if reason is not None and _score(winner, path[-1][2]) == 1.:
+                    node.winning = i
+                # random rollout from the new node
+                while reason is None:
+                    move = child_moves[rng.randrange(len(child_moves))]
+                    winner, reason, child_moves = compact_step(board, to_move, last_moves, played, move)
+                    to_move = ATK if to_move == DEF else DEF
+                    played += 1
+                break
+            node = node.children[i]
+        for node, i, mover in path:
+            node.visits[i] += 1
+            node.wins[i] += _score(winner, mover)
+    return root.visits, root.wins
+
+
+def _search_job(job: tuple) -> Tuple[List[int], List[float]]:
+    """
+    Run a search in a worker
+
+    :param job: The arguments of `mcts`
+    :return: The visits and wins of each searched root move
+    """
+    return mcts(*job)
+
+
+class ParallelSearch:
+    def __init__(self, n_workers: Optional[int] = None, c: float = 1.4, seed: int = 0):
+        """
+        Create a pool of processes to spread the search of a move across CPU cores.
+
+        Workers receive the position as a compact search state. Their results are merged in worker order, so equal
+        budgets in iterations give the same move on every run.
+
+        :param n_workers: The number of worker processes (by default, one per CPU)
+        :param c: The exploration constant
+        :param seed: The seed of the searches
+        """
+        self.n_workers = n_workers or os.cpu_count()
+        self.c = c
+        self.seed = seed
+        self.pool = multiprocessing.Pool(self.n_workers) if self.n_workers > 1 else None
+
+    def _run(self, jobs: List[tuple]) -> List[Tuple[List[int], List[float]]]:
+        """
+        Run the searches on the workers
+
+        :param jobs: The arguments of each search
+        :return: The results, in the same order
+        """
+        if self.pool is None:
+            return list(map(_search_job, jobs))
+        return self.pool.map(_search_job, jobs)
+
+    def root_parallel(self, state: Union[TablutEnv, SearchState], time_budget: Optional[float] = None,
+                      iterations: Optional[int] = None) -> Tuple[int, dict]:
+        """
+        Split the root moves among the workers, each searching its own share
+
+        :param state: The environment or the search state
+        :param time_budget: The time available, in seconds
+        :param iterations: The number of simulations of each worker
+        :return: The chosen action and the statistics of every root move
+        """
+        state = search_state(state) if isinstance(state, TablutEnv) else state
+        n = len(compact_legal_moves(state[0], state[1]))
+        deadline = self._deadline(time_budget)
+        shares = [list(range(k, n, self.n_workers)) for k in range(self.n_workers)]
+        shares = [share for share in shares if share]
+        jobs = [(state, iterations, deadline, share, self.seed + k, self.c) for k, share in enumerate(shares)]
+        visits = np.zeros(n, dtype=np.int64)
+        wins = np.zeros(n)
+        for share, (v, w) in zip(shares, self._run(jobs)):
+            visits[share] = v
+            wins[share] = w
+        # smoothed mean score, so barely visited moves don't win by chance
+        values = (wins + 0.5) / (visits + 1)
+        return self._result(state, np.lexsort((-visits, -values))[0], visits, wins)
+
+    def ensemble(self, state: Union[TablutEnv, SearchState], time_budget: Optional[float] = None,
+                 iterations: Optional[int] = None) -> Tuple[int, dict]:
+        """
+        Search the whole tree independently in each worker and merge the root visits
+
+        :param state: The environment or the search state
+        :param time_budget: The time available, in seconds
+        :param iterations: The number of simulations of each worker
+        :return: The chosen action and the statistics of every root move
+        """
+        state = search_state(state) if isinstance(state, TablutEnv) else state
+        n = len(compact_legal_moves(state[0], state[1]))
+        deadline = self._deadline(time_budget)
+        jobs = [(state, iterations, deadline, None, self.seed + k, self.c) for k in range(self.n_workers)]
+        visits = np.zeros(n, dtype=np.int64)
+        wins = np.zeros(n)
+        for v, w in self._run(jobs):
+            visits += v
+            wins += w
+        return self._result(state, np.lexsort((-wins, -visits))[0], visits, wins)
+
+    @staticmethod
+    def _deadline(time_budget: Optional[float]) -> Optional[float]:
+        """
+        Compute the deadline of the workers' searches, keeping a margin so the move is returned within the budget
+
+        :param time_budget: The time available, in seconds
+        :return: The deadline (as `time.time()`), or None without a time budget
+        """
+        if time_budget is None:
+            return None
+        return time.time() + time_budget - min(SEARCH_MARGIN, time_budget / 10)
+
+    @staticmethod
+    def _result(state: SearchState, action: int, visits: np.ndarray, wins: np.ndarray) -> Tuple[int, dict]:
+        """
+        Pack the result of a search
+
+        :param state: The search state
+        :param action: The chosen action
+        :param visits: The visits of each root move
+        :param wins: The wins of each root move
+        :return: The chosen action and the statistics of every root move
+        """
+        moves = [move_to_str(m) for m in compact_legal_moves(state[0], state[1])]
+        return int(action), {'moves': moves, 'visits': visits, 'wins': wins}
+
+    def close(self):
+        """
+        Terminate the worker processes
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,451 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+from collections import defaultdict
+from math import comb
+from typing import Dict
+
+from gym import logger
+
+from gym_tablut.envs._fast_engine import *
+
+# win/draw/loss values, from the point of view of the player to move
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+TB_DTYPE = np.dtype([('wdl', np.int8), ('dtr', np.uint16)])
+
+# the king is never on the edge in a non-terminal position; soldiers never stand on the throne
+KING_SQUARES = [sq for sq in range(N_SQUARES) if not EDGE[sq]]
+MAX_SOLDIERS = 16
+
+_COMB = [[comb(n, k) for k in range(MAX_SOLDIERS + 1)] for n in range(N_SQUARES + 1)]
+
+
+def table_name(n_atks: int, n_defs: int) -> str:
+    """
+    Get the file name of the table for the given material
+
+    :param n_atks: The number of attackers
+    :param n_defs: The number of defenders
+    :return: The file name
+    """
+    return f'k{n_atks}a{n_defs}d.npy'
+
+
+def _n_slots(king_sq: int) -> int:
+    """
+    Get the number of squares available to the soldiers
+
+    :param king_sq: The king's square
+    :return: The number of squares that are neither the throne nor the king's square
+    """
+    return N_SQUARES - 1 if king_sq == THRONE else N_SQUARES - 2
+
+
+def _king_block(n_slots: int, n_atks: int, n_defs: int) -> int:
+    """
+    Get the number of positions with the king on a given square
+
+    :param n_slots: The number of squares available to the soldiers
+    :param n_atks: The number of attackers
+    :param n_defs: The number of defenders
+    :return: The number of positions
+    """
+    return _COMB[n_slots][n_atks] * _COMB[n_slots - n_atks][n_defs]
+
+
+def table_size(n_atks: int, n_defs: int) -> int:
+    """
+    Get the number of positions (for a single player to move) with the given material
+
+    :param n_atks: The number of attackers
+    :param n_defs: The number of defenders
+    :return: The number of positions
+    """
+    return sum(_king_block(_n_slots(k), n_atks, n_defs) for k in KING_SQUARES)
+
+
+def _king_offsets(n_atks: int, n_defs: int) -> Dict[int, int]:
+    """
+    Compute the index of the first position for each king's square
+
+    :param n_atks: The number of attackers
+    :param n_defs: The number of defenders
+    :return: A dictionary from king's square to offset
+    """
+    offsets = {}
+    offset = 0
+    for k in KING_SQUARES:
+        offsets[k] = offset
+        offset += _king_block(_n_slots(k), n_atks, n_defs)
+    return offsets
+
+
+_OFFSETS = {}
+
+
+def _rank(slots: Sequence[int]) -> int:
+    """
+    Rank a sorted combination in colexicographic order
+
+    :param slots: The sorted combination
+    :return: The combination's rank
+    """
+    r = 0
+    for k, s in enumerate(slots):
+        r += _COMB[s][k + 1]
+    return r
+
+
+def _unrank(r: int, k: int) -> List[int]:
+    """
+    Compute the sorted combination of `k` elements with the given colexicographic rank
+
+    :param r: The rank
+    :param k: The number of elements
+    :return: The sorted combination
+    """
+    slots = []
+    s = N_SQUARES
+    for i in range(k, 0, -1):
+        s -= 1
+        while _COMB[s][i] > r:
+            s -= 1
+        slots.append(s)
+        r -= _COMB[s][i]
+    return slots[::-1]
+
+
+def _squares_of(cells: bytes, piece: int) -> List[int]:
+    """
+    Find the squares holding the given piece
+
+    :param cells: The encoded board
+    :param piece: The piece code
+    :return: The sorted list of squares
+    """
+    squares = []
+    sq = cells.find(piece)
+    while sq >= 0:
+        squares.append(sq)
+        sq = cells.find(piece, sq + 1)
+    return squares
+
+
+def position_index(cells: Sequence[int]) -> Tuple[int, int, int]:
+    """
+    Compute the perfect index of the position on the encoded board.
+
+    Each position with the king off the edge maps to a distinct index within the table for its material; the king's
+    square is ranked first, then the attackers' and defenders' squares as combinations over the free squares.
+
+    :param cells: The encoded board
+    :return: The number of attackers, the number of defenders and the index of the position
+    """
+    if not isinstance(cells, (bytes, bytearray)):
+        cells = bytes(cells)
+    king_sq = cells.find(KING_PIECE)
+    assert king_sq >= 0 and not EDGE[king_sq], '[ERR: position_index] The king must be on the board and off the edge'
+    # the slots are the squares, skipping the throne and the king's square
+    after_king = N_SQUARES if king_sq == THRONE else king_sq
+    atks = [sq - (sq > THRONE) - (sq > after_king) for sq in _squares_of(cells, ATK_PIECE)]
+    defs = [sq - (sq > THRONE) - (sq > after_king) for sq in _squares_of(cells, DEF_PIECE)]
+    n_atks, n_defs = len(atks), len(defs)
+    # rank defenders among the squares left free by the attackers
+    d_slots = []
+    a = 0
+    for s in defs:
+        while a < n_atks and atks[a] < s:
+            a += 1
+        d_slots.append(s - a)
+    n_free = _n_slots(king_sq) - n_atks
+    offsets = _OFFSETS.get((n_atks, n_defs))
+    if offsets is None:
+        offsets = _OFFSETS[(n_atks, n_defs)] = _king_offsets(n_atks, n_defs)
+    idx = offsets[king_sq] + _rank(atks) * _COMB[n_free][n_defs] + _rank(d_slots)
+    return n_atks, n_defs, idx
+
+
+def _king_positions(king_sq: int, n_atks: int, n_defs: int):
+    """
+    Enumerate all positions with the given material and the king on the given square
+
+    :param king_sq: The king's square
+    :param n_atks: The number of attackers
+    :param n_defs: The number of defenders
+    :return: A generator of encoded boards, in index order
+    """
+    squares = [sq for sq in range(N_SQUARES) if sq != THRONE and sq != king_sq]
+    n_free = len(squares) - n_atks
+    for a_rank in range(_COMB[len(squares)][n_atks]):
+        a_slots = _unrank(a_rank, n_atks)
+        atk_squares = [squares[s] for s in a_slots]
+        free = [sq for sq in squares if sq not in atk_squares]
+        for d_rank in range(_COMB[n_free][n_defs]):
+            cells = bytearray(N_SQUARES)
+            cells[king_sq] = KING_PIECE
+            for sq in atk_squares:
+                cells[sq] = ATK_PIECE
+            for s in _unrank(d_rank, n_defs):
+                cells[free[s]] = DEF_PIECE
+            yield cells
+
+
+def _unmoves(cells: bytearray, player: int) -> List[Tuple[int, int]]:
+    """
+    Compute the non-capturing moves of the player that lead to the encoded board
+
+    :param cells: The encoded board, after the move
+    :param player: The player that moved
+    :return: A list of moves as (`from_square`, `to_square`)
+    """
+    moves = []
+    for sq in range(N_SQUARES):
+        p = cells[sq]
+        if p == EMPTY or (p == ATK_PIECE) != (player == ATK):
+            continue
+        # a move producing captures leads somewhere else
+        if compact_process_captures(cells, sq):
+            continue
+        for ray in RAYS[sq]:
+            for frm in ray:
+                if cells[frm] != EMPTY:
+                    break
+                if frm == THRONE and p != KING_PIECE:
+                    continue
+                if p == KING_PIECE and EDGE[frm]:
+                    continue
+                moves.append((frm, sq))
+    return moves
+
+
+class Tablebase:
+    def __init__(self, directory: str):
+        """
+        Open the endgame tablebase stored in the directory.
+
+        Tables are memory-mapped lazily, the first time a position with their material is probed.
+
+        :param directory: The directory containing the tables
+        """
+        self.directory = directory
+        self.tables = {}
+
+    def table(self, n_atks: int, n_defs: int) -> Optional[np.ndarray]:
+        """
+        Get the table for the given material
+
+        :param n_atks: The number of attackers
+        :param n_defs: The number of defenders
+        :return: The memory-mapped table, or None if it hasn't been built
+        """
+        key = (n_atks, n_defs)
+        if key not in self.tables:
+            path = os.path.join(self.directory, table_name(n_atks, n_defs))
+            self.tables[key] = np.load(path, mmap_mode='r') if os.path.exists(path) else None
+        return self.tables.get(key)
+
+    def probe(self, board, player: int) -> Optional[Tuple[int, int]]:
+        """
+        Look up the position in the tablebase.
+
+        Values assume neither repetitions nor the maximum number of moves end the game.
+
+        :param board: The board, either a `Board` or an encoded board
+        :param player: The player to move
+        :return: The result (WIN, DRAW or LOSS for the player to move) and the number of plies to it, or None if the
+        position is not in the tablebase
+        """
+        cells = encode_board(board) if isinstance(board, Board) else board
+        king_sq = find_king(cells)
+        if king_sq is None or EDGE[king_sq]:
+            return None
+        n_atks, n_defs, idx = position_index(cells)
+        table = self.table(n_atks, n_defs)
+        if table is None:
+            return None
+        entry = table[player, idx]
+        return int(entry['wdl']), int(entry['dtr'])
+
+
+def _forward_block(job: Tuple[str, int, int, int]) -> Tuple[int, Tuple[np.ndarray, ...]]:
+    """
+    Run the forward pass of `build_table` on the positions with the king on a given square, in a worker: count the
+    children in the table and score the ones that leave it
+
+    :param job: The tablebase directory, the number of attackers, the number of defenders and the king's square
+    :return: The king's square and, for both players, the children still undecided, the best win and the worst loss
+    through resolved children and the draws through captures
+    """
+    directory, n_atks, n_defs, king_sq = job
+    tablebase = Tablebase(directory)
+    size = _king_block(_n_slots(king_sq), n_atks, n_defs)
+    remaining = np.zeros((2, size), dtype=np.uint16)
+    best_win = np.zeros((2, size), dtype=np.uint16)
+    worst_loss = np.zeros((2, size), dtype=np.uint16)
+    drawn = np.zeros((2, size), dtype=bool)
+    for idx, cells in enumerate(_king_positions(king_sq, n_atks, n_defs)):
+        for player in [DEF, ATK]:
+            opponent = ATK if player == DEF else DEF
+            for move in compact_legal_moves(cells, player):
+                child = bytearray(cells)
+                _, captured, outcome = compact_apply_move(child, move)
+                if outcome != ONGOING:
+                    best_win[player, idx] = 1
+                elif captured:
+                    c_atks, c_defs, c_idx = position_index(child)
+                    entry = tablebase.table(c_atks, c_defs)[opponent, c_idx]
+                    c_wdl, c_dtr = int(entry['wdl']), int(entry['dtr'])
+                    if c_wdl == LOSS:
+                        if best_win[player, idx] == 0 or c_dtr + 1 < best_win[player, idx]:
+                            best_win[player, idx] = c_dtr + 1
+                    elif c_wdl == WIN:
+                        worst_loss[player, idx] = max(worst_loss[player, idx], c_dtr + 1)
+                    else:
+                        drawn[player, idx] = True
+                else:
+                    remaining[player, idx] += 1
+    return king_sq, (remaining, best_win, worst_loss, drawn)
+
+
+def build_table(tablebase: Tablebase, n_atks: int, n_defs: int, n_workers: Optional[int] = None):
+    """
+    Solve all positions with the given material by retrograde analysis.
+
+    All tables with less material must already be in the tablebase. Children reached by a capture are looked up in
+    those tables, the others are solved level by level walking the moves backwards from the decided positions. The
+    forward pass is split by king square among worker processes, the backward pass runs in this process.
+
+    :param tablebase: The tablebase to write the table into
+    :param n_atks: The number of attackers
+    :param n_defs: The number of defenders
+    :param n_workers: The number of worker processes (by default, one per CPU)
+    """
+    size = table_size(n_atks, n_defs)
+    wdl = np.zeros((2, size), dtype=np.int8)
+    dtr = np.zeros((2, size), dtype=np.uint16)
+    # number of children still undecided, best win and worst loss through resolved children, draws through captures
+    remaining = np.zeros((2, size), dtype=np.uint16)
+    best_win = np.zeros((2, size), dtype=np.uint16)
+    worst_loss = np.zeros((2, size), dtype=np.uint16)
+    drawn = np.zeros((2, size), dtype=bool)
+
+    # forward pass, one block of positions per king square
+    offsets = _king_offsets(n_atks, n_defs)
+    jobs = [(tablebase.directory, n_atks, n_defs, king_sq) for king_sq in KING_SQUARES]
+    n_workers = min(n_workers or os.cpu_count(), len(jobs))
+    pool = multiprocessing.Pool(n_workers) if n_workers > 1 else None
+    try:
+        blocks = pool.imap_unordered(_forward_block, jobs) if pool is not None else map(_forward_block, jobs)
+        for king_sq, block in blocks:
+            start = offsets.get(king_sq)
+            end = start + block[0].shape[1]
+            for array, values in zip([remaining, best_win, worst_loss, drawn], block):
+                array[:, start:end] = values
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    levels = defaultdict(list)
+    for idx, player in zip(*np.nonzero((best_win > 0).T)):
+        levels[int(best_win[player, idx])].append((int(player), int(idx), WIN))
+    for idx, player in zip(*np.nonzero(((best_win == 0) & (remaining == 0) & ~drawn).T)):
+        levels[int(worst_loss[player, idx])].append((int(player), int(idx), LOSS))
+
+    # backward pass: decide positions in order of distance to result
+    level = 0
+    while levels:
+        for player, idx, result in levels.pop(level, []):
+            if wdl[player, idx] != DRAW:
+                continue
+            wdl[player, idx] = result
+            dtr[player, idx] = level
+            # the parents are the positions of the opponent moving into this one
+            opponent = ATK if player == DEF else DEF
+            cells = _position_at(n_atks, n_defs, idx)
+            for frm, to in _unmoves(cells, opponent):
+                parent = bytearray(cells)
+                parent[frm], parent[to] = parent[to], EMPTY
+                _, _, p_idx = position_index(parent)
+                if wdl[opponent, p_idx] != DRAW:
+                    continue
+                if result == LOSS:
+                    levels[level + 1].append((opponent, p_idx, WIN))
+                else:
+                    remaining[opponent, p_idx] -= 1
+                    if remaining[opponent, p_idx] == 0 and best_win[opponent, p_idx] == 0 \
+                            and not drawn[opponent, p_idx]:
+                        levels[max(level + 1, int(worst_loss[opponent, p_idx]))].append((opponent, p_idx, LOSS))
+        level += 1
+
+    path = os.path.join(tablebase.directory, table_name(n_atks, n_defs))
+    table = np.lib.format.open_memmap(path, mode='w+', dtype=TB_DTYPE, shape=(2, size))
+    table['wdl'] = wdl
+    table['dtr'] = dtr
+    table.flush()
+    del table
+    tablebase.tables.pop((n_atks, n_defs), None)
+
+
+def _position_at(n_atks: int, n_defs: int, idx: int) -> bytearray:
+    """
+    Decode the position with the given index
+
+    :param n_atks: The number of attackers
+    :param n_defs: The number of defenders
+    :param idx: The index of the position
+    :return: The encoded board
+    """
+    offsets = _OFFSETS.get((n_atks, n_defs))
+    if offsets is None:
+        offsets = _OFFSETS[(n_atks, n_defs)] = _king_offsets(n_atks, n_defs)
+    king_sq = max(k for k in KING_SQUARES if offsets[k] <= idx)
+    idx -= offsets[king_sq]
+    squares = [sq for sq in range(N_SQUARES) if sq != THRONE and sq != king_sq]
+    n_free = len(squares) - n_atks
+    a_rank, d_rank = divmod(idx, _COMB[n_free][n_defs])
+    atk_squares = [squares[s] for s in _unrank(a_rank, n_atks)]
+    free = [sq for sq in squares if sq not in atk_squares]
+    cells = bytearray(N_SQUARES)
+    cells[king_sq] = KING_PIECE
+    for sq in atk_squares:
+        cells[sq] = ATK_PIECE
+    for s in _unrank(d_rank, n_defs):
+        cells[free[s]] = DEF_PIECE
+    return cells
+
+
+def build_tablebase(directory: str, max_atks: int, max_defs: int, n_workers: Optional[int] = None) -> Tablebase:
+    """
+    Build the tablebase for all material up to the king with `max_atks` attackers and `max_defs` defenders.
+
+    Existing tables are kept. The number of positions grows quickly with the material: the king with two attackers
+    and one defender already counts about 23 million positions.
+
+    :param directory: The directory to store the tables in
+    :param max_atks: The maximum number of attackers
+    :param max_defs: The maximum number of defenders
+    :param n_workers: The number of worker processes (by default, one per CPU)
+    :return: The tablebase
+    """
+    os.makedirs(directory, exist_ok=True)
+    tablebase = Tablebase(directory)
+    # captures only ever remove material, so smaller tables are built first
+    for n_atks, n_defs in sorted(itertools.product(range(max_atks + 1), range(max_defs + 1)), key=sum):
+        if tablebase.table(n_atks, n_defs) is None:
+            logger.info(f'Building table with {n_atks} attacker(s) and {n_defs} defender(s)')
+            build_table(tablebase, n_atks, n_defs, n_workers)
+    return tablebase
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the Tablut endgame tablebase')
+    parser.add_argument('directory', help='The directory to store the tables in')
+    parser.add_argument('--atks', type=int, default=2, help='The maximum number of attackers')
+    parser.add_argument('--defs', type=int, default=0, help='The maximum number of defenders')
+    parser.add_argument('--workers', type=int, default=None, help='The number of worker processes')
+    args = parser.parse_args()
+    build_tablebase(args.directory, args.atks, args.defs, args.workers)
@@ -0,0 +1,344 @@
+import importlib
+import itertools
+import math
+import multiprocessing
+import os
+import queue
+import random
+from collections import Counter
+from statistics import NormalDist
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from gym_tablut.envs._globals import *
+from gym_tablut.envs.tablut_env import TablutEnv
+
+# Elo points per unit of the logistic scale
+ELO_SCALE = 400. / math.log(10.)
+# normal quantiles for the usual confidence levels
+_Z = {0.9: 1.645, 0.95: 1.96, 0.99: 2.576}
+
+
+def _random_action(env: TablutEnv, rng: random.Random) -> int:
+    """
+    Pick a legal action uniformly at random
+
+    :param env: The environment, on the player's turn
+    :param rng: The random number generator
+    :return: The chosen action
+    """
+    return rng.randrange(len(env.actions))
+
+
+def _random_policy_factory() -> Callable:
+    """
+    Load the random policy
+
+    :return: The policy
+    """
+    return _random_action
+
+
+# policy name -> factory (or `module:attribute` string of a factory) returning a function `(env, rng) -> action`
+POLICIES = {
+    'random': _random_policy_factory
+}
+
+
+def register_policy(name: str, factory: Union[str, Callable]):
+    """
+    Register a policy for tournaments.
+
+    The factory is called once in each worker process to load the policy, so it has to be picklable (e.g. a module
+    level function) or given as a `module:attribute` string.
+
+    :param name: The policy name
+    :param factory: The factory returning a function `(env, rng) -> action`
+    """
+    POLICIES[name] = factory
+
+
+def _load_policy(factory: Union[str, Callable]) -> Callable:
+    """
+    Load a policy from its factory
+
+    :param factory: The factory or its `module:attribute` string
+    :return: The policy
+    """
+    if isinstance(factory, str):
+        module, attribute = factory.split(':')
+        factory = getattr(importlib.import_module(module), attribute)
+    return factory()
+
+
+# per-worker state, set by `_init_worker`
+_WORKER_POLICIES = {}
+_WORKER_ENV = None
+
+
+def _init_worker(factories: Dict[str, Union[str, Callable]]):
+    """
+    Load the policies and the environment of a worker process
+
+    :param factories: The factories of the policies playing in the tournament
+    """
+    global _WORKER_ENV
+    _WORKER_POLICIES.clear()
+    for name, factory in factories.items():
+        _WORKER_POLICIES[name] = _load_policy(factory)
+    _WORKER_ENV = TablutEnv()
+
+
+def _play_game(game: Tuple[str, str, int]) -> Tuple[str, str, Optional[str], str]:
+    """
+    Play a match in the worker
+
+    :param game: The attacker's policy, the defender's policy and the seed of the match
+    :return: The attacker's policy, the defender's policy, the winner (`ATK`, `DEF` or None for a draw) and the reason
+    """
+    atk, _def, seed = game
+    env = _WORKER_ENV
+    policies = {ATK: _WORKER_POLICIES.get(atk), DEF: _WORKER_POLICIES.get(_def)}
+    rng = random.Random(seed)
+    env.reset()
+    info = {}
+    while not env.done:
+        _, _, _, info = env.step(policies.get(env.player)(env, rng))
+    return atk, _def, info.get('winner'), info.get('reason')
+
+
+def fit_ratings(names: List[str], results: Dict[Tuple[str, str], dict],
+                prior: float = 1.) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    Fit Elo ratings to the results by maximum a posteriori estimation.
+
+    The attacker wins with probability `1 / (1 + 10^((r_def - r_atk - adv) / 400))`, where `adv` is the attacker's
+    advantage (usually negative: defending is easier); draws count as half a win, and a normal prior with standard
+    deviation `prior` (in logistic units) keeps ratings finite for unbeaten policies, as in BayesElo.
+
+    :param names: The policies
+    :param results: The results of each (attacker, defender) pair
+    :param prior: The standard deviation of the prior on ratings, in logistic units
+    :return: The ratings in Elo points (mean 0), their covariance matrix in Elo points and the attacker's advantage
+    """
+    k = len(names)
+    idx = {name: i for i, name in enumerate(names)}
+    pairs = []
+    for (atk, _def), r in results.items():
+        n = r.get('ATK') + r.get('DEF') + r.get('draws')
+        if n > 0:
+            pairs.append((idx.get(atk), idx.get(_def), n, r.get('ATK') + 0.5 * r.get('draws')))
+    # parameters: the ratings and the attacker's advantage, which has a much looser prior
+    x = np.zeros(k + 1)
+    precision = np.full(k + 1, 1. / prior ** 2)
+    precision[k] = 1e-2
+    hessian = -np.diag(precision)
+    for _ in range(100):
+        gradient = -x * precision
+        hessian = -np.diag(precision)
+        for i, j, n, s in pairs:
+            p = 1. / (1. + math.exp(x[j] - x[i] - x[k]))
+            g = s - n * p
+            h = n * p * (1. - p)
+            v = np.zeros(k + 1)
+            v[i], v[j], v[k] = 1., -1., 1.
+            gradient += g * v
+            hessian -= h * np.outer(v, v)
+        step = np.linalg.solve(hessian, -gradient)
+        # damped Newton steps, the likelihood is very flat when a side always wins
+        x += np.clip(step, -1., 1.)
+        if np.abs(step).max() < 1e-9:
+            break
+    covariance = np.linalg.inv(-hessian)[:k, :k]
+    # center the ratings, and their covariance
+    center = np.eye(k) - np.ones((k, k)) / k
+    ratings = center @ x[:k]
+    covariance = center @ covariance @ center.T
+    return ratings * ELO_SCALE, covariance * ELO_SCALE ** 2, x[k] * ELO_SCALE
+
+
+class Tournament:
+    def __init__(self, policies: List[str], mode: str = 'round-robin', challenger: Optional[str] = None,
+                 max_games: int = 100, min_games: int = 10, n_workers: Optional[int] = None,
+                 confidence: float = 0.95, seed: int = 0):
+        """
+        Create a tournament between registered policies.
+
+        Every pair of policies plays in both roles. In a round-robin everyone plays everyone, in a gauntlet only the
+        challenger plays against the others.
+
+        :param policies: The names of the registered policies
+        :param mode: Either `round-robin` or `gauntlet`
+        :param challenger: The challenger of a gauntlet
+        :param max_games: The maximum number of games per pair and role
+        :param min_games: The number of games per pair and role to play before stopping early
+        :param n_workers: The number of worker processes (by default, one per CPU)
+        :param confidence: The confidence level of the rating intervals, one of 0.9, 0.95 or 0.99
+        :param seed: The seed of the matches
+        """
+        assert mode in ['round-robin', 'gauntlet'], f"[ERR: Tournament] Unrecognized mode: {mode}"
+        assert mode != 'gauntlet' or challenger in policies, '[ERR: Tournament] The challenger must be playing'
+        assert confidence in _Z, f"[ERR: Tournament] Unsupported confidence level: {confidence}"
+        for name in policies:
+            assert name in POLICIES, f"[ERR: Tournament] Unregistered policy: {name}"
+        self.policies = list(policies)
+        self.mode = mode
+        self.challenger = challenger
+        self.max_games = max_games
+        self.min_games = min_games
+        self.n_workers = n_workers or os.cpu_count()
+        self.z = _Z.get(confidence)
+        # the ratings are checked at most once per round of games after the first `min_games` rounds, so each check is
+        # made at a Bonferroni-adjusted level to keep the overall chance of a wrong stop within the confidence level
+        n_checks = max(max_games - min_games + 1, 1)
+        self.stop_z = NormalDist().inv_cdf(1. - (1. - confidence) / (2. * n_checks))
+        self.seed = seed
+        if mode == 'round-robin':
+            self.pairs = list(itertools.permutations(self.policies, 2))
+        else:
+            others = [p for p in self.policies if p != challenger]
+            self.pairs = [(challenger, p) for p in others] + [(p, challenger) for p in others]
+        # results of each (attacker, defender) pair and win/draw/loss tables of each policy by reason
+        self.results = {pair: {'ATK': 0, 'DEF': 0, 'draws': 0} for pair in self.pairs}
+        self.tables = {name: {'win': Counter(), 'draw': Counter(), 'loss': Counter()} for name in self.policies}
+        self.n_games = 0
+
+    def record(self, atk: str, _def: str, winner: Optional[str], reason: str):
+        """
+        Add the result of a match
+
+        :param atk: The attacker's policy
+        :param _def: The defender's policy
+        :param winner: The winner (`ATK`, `DEF` or None for a draw)
+        :param reason: The reason the match ended
+        """
+        result = self.results.get((atk, _def))
+        if winner is None:
+            result['draws'] += 1
+            self.tables.get(atk).get('draw')[reason] += 1
+            self.tables.get(_def).get('draw')[reason] += 1
+        else:
+            result[winner] += 1
+            w, l = (atk, _def) if winner == 'ATK' else (_def, atk)
+            self.tables.get(w).get('win')[reason] += 1
+            self.tables.get(l).get('loss')[reason] += 1
+        self.n_games += 1
+
+    def separated(self, z: Optional[float] = None) -> bool:
+        """
+        Check whether the ratings are statistically separated: adjacent policies in the ranking (or the challenger and
+        each opponent, in a gauntlet) differ by more than the confidence interval of their difference
+
+        :param z: The normal quantile of the confidence intervals (by default, the one of the confidence level)
+        :return: True if the ratings are separated, False otherwise
+        """
+        ratings, covariance, _ = fit_ratings(self.policies, self.results)
+        if self.mode == 'gauntlet':
+            c = self.policies.index(self.challenger)
+            pairs = [(c, i) for i in range(len(self.policies)) if i != c]
+        else:
+            order = np.argsort(ratings)
+            pairs = list(zip(order[:-1], order[1:]))
+        for i, j in pairs:
+            sd = math.sqrt(max(covariance[i, i] + covariance[j, j] - 2 * covariance[i, j], 0.))
+            if abs(ratings[i] - ratings[j]) <= (self.z if z is None else z) * sd:
+                return False
+        return True
+
+    def _schedule(self) -> Iterator[Tuple[str, str, int]]:
+        """
+        Generate the matches to play, one per pair and role at a time
+
+        :return: A generator of the attacker's policy, the defender's policy and the seed of each match
+        """
+        for r in range(self.max_games):
+            for k, (atk, _def) in enumerate(self.pairs):
+                yield atk, _def, self.seed + r * len(self.pairs) + k
+
+    def _done(self) -> bool:
+        """
+        Check whether the tournament can stop: the checks are made once per round of games (one per pair and role),
+        after every pair and role played the minimum number of games, at the adjusted level `stop_z`
+
+        :return: True if the tournament can stop, False otherwise
+        """
+        if self.n_games % len(self.pairs) != 0:
+            return False
+        played = min(r.get('ATK') + r.get('DEF') + r.get('draws') for r in self.results.values())
+        return played >= self.min_games and self.separated(self.stop_z)
+
+    def run(self) -> List[dict]:
+        """
+        Play the tournament until the ratings are separated or the maximum number of games is reached.
+
+        Workers are kept busy with twice as many matches in flight as there are workers; results are aggregated as
+        soon as each match ends, and no more matches are submitted once the ratings are separated. Separation is
+        checked after each round of games (one per pair and role) once `min_games` rounds are played, with a
+        Bonferroni correction over the at most `max_games - min_games + 1` checks, so the chance of stopping between
+        equally strong policies stays within `1 - confidence`.
+
+        :return: The standings (see `standings`)
+        """
+        factories = {name: POLICIES.get(name) for name in self.policies}
+        games = self._schedule()
+        results = queue.Queue()
+        pool = None
+        if self.n_workers > 1:
+            pool = multiprocessing.Pool(self.n_workers, initializer=_init_worker, initargs=(factories,))
+        else:
+            _init_worker(factories)
+
+        def submit() -> bool:
+            game = next(games, None)
+            if game is None:
+                return False
+            if pool is None:
+                results.put(_play_game(game))
+            else:
+                pool.apply_async(_play_game, (game,), callback=results.put, error_callback=results.put)
+            return True
+
+        try:
+            in_flight = 0
+            while in_flight < 2 * self.n_workers and submit():
+                in_flight += 1
+            stopped = False
+            while in_flight > 0:
+                result = results.get()
+                in_flight -= 1
+                if isinstance(result, BaseException):
+                    raise result
+                self.record(*result)
+                # matches already in flight are still recorded after stopping
+                stopped = stopped or self._done()
+                if not stopped and submit():
+                    in_flight += 1
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        return self.standings()
+
+    def standings(self) -> List[dict]:
+        """
+        Rank the policies by rating
+
+        :return: For each policy, sorted by rating: its name, Elo rating, confidence interval and win, draw and loss
+        tables by reason
+        """
+        ratings, covariance, _ = fit_ratings(self.policies, self.results)
+        standings = []
+        for i, name in enumerate(self.policies):
+            margin = self.z * math.sqrt(max(covariance[i, i], 0.))
+            table = self.tables.get(name)
+            standings.append({
+                'name': name,
+                'elo': ratings[i],
+                'ci': (ratings[i] - margin, ratings[i] + margin),
+                'wins': sum(table.get('win').values()),
+                'draws': sum(table.get('draw').values()),
+                'losses': sum(table.get('loss').values()),
+                'reasons': table
+            })
+        return sorted(standings, key=lambda s: -s.get('elo'))
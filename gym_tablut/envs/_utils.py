@@ -177,35 +177,19 @@ def check_threefold_repetition(last_moves, last_move):
                 last_moves[5] == last_moves[1])
 
 
+# standard Tablut configuration, as array positions of each piece type
+STARTING_LAYOUT = {
+    KING: [(4, 4)],
+    DEFENDER: [(2, 4), (3, 4), (4, 2), (4, 3), (4, 5), (4, 6), (5, 4), (6, 4)],
+    ATTACKER: [(0, 3), (0, 4), (0, 5), (1, 4), (3, 0), (3, 8), (4, 0), (4, 1), (4, 7), (4, 8), (5, 0), (5, 8), (7, 4),
+               (8, 3), (8, 4), (8, 5)]
+}
+
+
 def fill_board(board: Board):
     """
     Populate the board. By default, uses the standard Tablut configuration
     """
-    # add king
-    board.state[4, 4] = King(arr_to_pos(board, (4, 4)))
-    # add defenders
-    board.state[2, 4] = Defender(arr_to_pos(board, (2, 4)))
-    board.state[3, 4] = Defender(arr_to_pos(board, (3, 4)))
-    board.state[4, 2] = Defender(arr_to_pos(board, (4, 2)))
-    board.state[4, 3] = Defender(arr_to_pos(board, (4, 3)))
-    board.state[4, 5] = Defender(arr_to_pos(board, (4, 5)))
-    board.state[4, 6] = Defender(arr_to_pos(board, (4, 6)))
-    board.state[5, 4] = Defender(arr_to_pos(board, (5, 4)))
-    board.state[6, 4] = Defender(arr_to_pos(board, (6, 4)))
-    # add attackers
-    board.state[0, 3] = Attacker(arr_to_pos(board, (0, 3)))
-    board.state[0, 4] = Attacker(arr_to_pos(board, (0, 4)))
-    board.state[0, 5] = Attacker(arr_to_pos(board, (0, 5)))
-    board.state[1, 4] = Attacker(arr_to_pos(board, (1, 4)))
-    board.state[3, 0] = Attacker(arr_to_pos(board, (3, 0)))
-    board.state[3, 8] = Attacker(arr_to_pos(board, (3, 8)))
-    board.state[4, 0] = Attacker(arr_to_pos(board, (4, 0)))
-    board.state[4, 1] = Attacker(arr_to_pos(board, (4, 1)))
-    board.state[4, 7] = Attacker(arr_to_pos(board, (4, 7)))
-    board.state[4, 8] = Attacker(arr_to_pos(board, (4, 8)))
-    board.state[5, 0] = Attacker(arr_to_pos(board, (5, 0)))
-    board.state[5, 8] = Attacker(arr_to_pos(board, (5, 8)))
-    board.state[7, 4] = Attacker(arr_to_pos(board, (7, 4)))
-    board.state[8, 3] = Attacker(arr_to_pos(board, (8, 3)))
-    board.state[8, 4] = Attacker(arr_to_pos(board, (8, 4)))
-    board.state[8, 5] = Attacker(arr_to_pos(board, (8, 5)))
+    for _type, positions in STARTING_LAYOUT.items():
+        for i, j in positions:
+            board.state[i, j] = PIECE_CLASSES.get(_type)(arr_to_pos(board, (i, j)))
@@ -1,8 +1,12 @@
+from typing import Optional
+
 import gym
 from gym import spaces, logger
 from gym.utils import seeding
 
 from gym_tablut.envs._game_engine import *
+from gym_tablut.envs._fast_engine import compact_apply_move, encode_board, playout, str_to_move
+from gym_tablut.envs._tablebase import Tablebase
 
 
 class TablutEnv(gym.Env):
@@ -29,6 +33,8 @@ class TablutEnv(gym.Env):
         self.rgb_state = RENDER_STATE
         self.last_moves = []
         self.n_moves = 0
+        # optional MoveCache for legal moves and captures
+        self.cache = None
 
     def step(self, action: int) -> Tuple[np.ndarray, int, bool, dict]:
         """
@@ -47,7 +53,16 @@ class TablutEnv(gym.Env):
             logger.debug(f"{'Attacker' if self.player == ATK else 'Defender'} moved {self.actions[action]}")
 
             move = split_move(self.actions[action])
-            rewards, captured = apply_move(self.board, move)
+            captures = None
+            cells = None
+            if self.cache is not None:
+                # the encoded board is kept in sync with the move, so it's encoded once per step
+                cells = encode_board(self.board)
+                compact_move = str_to_move(self.actions[action])
+                captured = self.cache.captures(cells, self.player, compact_move)
+                captures = [divmod(sq, self.board.cols) for sq in captured]
+                compact_apply_move(cells, compact_move, captured)
+            rewards, captured = apply_move(self.board, move, captures)
 
             if len(captured) > 0:
                 s = []
@@ -62,7 +77,7 @@ class TablutEnv(gym.Env):
             # check if game is over
             self.done = self.board.king_escaped or not self.board.king_alive
             if self.done:
-                reason = 'King has escaped' if self.board.king_escaped else 'King was captured'
+                reason = ESCAPED_REASON if self.board.king_escaped else CAPTURED_REASON
                 info['winner'] = 'DEF' if self.board.king_escaped else 'ATK'
                 info['reason'] = reason
                 info['last_move'] = self.actions[action]
@@ -75,7 +90,7 @@ class TablutEnv(gym.Env):
                     f"Match ended; reason: Threefold repetition; DRAW")
                 self.done = True
                 rewards = DRAW_REWARD
-                info['reason'] = 'Threefold repetition'
+                info['reason'] = REPETITION_REASON
                 info['last_move'] = self.actions[action]
                 info['n_atks'] = self.board.count(ATTACKER)
                 info['n_defs'] = self.board.count(DEFENDER)
@@ -83,7 +98,7 @@ class TablutEnv(gym.Env):
             elif self.n_moves == MAX_MOVES:
                 self.done = True
                 rewards = 0
-                info['reason'] = 'Maximum number of moves reached'
+                info['reason'] = MAX_MOVES_REASON
                 info['last_move'] = self.actions[action]
                 info['n_atks'] = self.board.count(ATTACKER)
                 info['n_defs'] = self.board.count(DEFENDER)
@@ -94,7 +109,7 @@ class TablutEnv(gym.Env):
 
                 # update the action space
                 self.player = ATK if self.player == DEF else DEF
-                self.actions = legal_moves(self.board, self.player)
+                self.actions = self._legal_moves(self.player, cells)
                 self.action_space = spaces.Discrete(len(self.actions))
 
                 # no moves for the opponent check
@@ -102,7 +117,7 @@ class TablutEnv(gym.Env):
                     self.done = True
                     rewards = CAPTURE_REWARDS.get('king')
                     info['winner'] = 'ATK' if self.player == DEF else 'DEF'
-                    info['reason'] = 'No more moves available'
+                    info['reason'] = NO_MOVES_REASON
                     info['n_atks'] = self.board.count(ATTACKER)
                     info['n_defs'] = self.board.count(DEFENDER)
                     logger.debug(
@@ -112,28 +127,70 @@ class TablutEnv(gym.Env):
 
         return obs, rewards, self.done, info
 
-    def reset(self):
+    def reset(self, options: Optional[dict] = None):
         """
         Reset the current scene, computing the observations
 
+        :param options: If it has a `pool` (a `PositionPool`), the match starts from a position sampled from it instead
+        of the standard configuration
         :return: The state observations
         """
         if self.viewer:
             remove_pieces_from_render(self.viewer, self.board)
         self.done = False
         # place pieces
-        self.board.reset()
-        fill_board(self.board)
+        pool = options.get('pool') if options else None
+        if pool is None:
+            self.board.reset()
+            fill_board(self.board)
+            self.player = STARTING_PLAYER
+            self.n_moves = 0
+        else:
+            cells, self.player, self.n_moves = pool.sample()
+            self.board.load(cells)
         if self.viewer:
             add_pieces_to_render(self.viewer, self.board)
         # initialize action space
-        self.actions = legal_moves(self.board, STARTING_PLAYER)
+        self.actions = self._legal_moves(self.player)
         self.action_space = spaces.Discrete(len(self.actions))
         self.last_moves = []
-        self.n_moves = 0
         logger.debug('New match started')
         return self.board.as_state(self.rgb_state)
 
+    def _legal_moves(self, player: int, cells: Optional[bytearray] = None) -> np.ndarray:
+        """
+        Compute the legal moves for the player, through the cache if there is one
+
+        :param player: The player
+        :param cells: The encoded board, if already available
+        :return: A numpy array of moves in string format `from`-`to`
+        """
+        if self.cache is None:
+            return legal_moves(self.board, player)
+        return self.cache.actions(encode_board(self.board) if cells is None else cells, player)
+
+    def playout(self, policy='random', n: int = 1, seed: Optional[int] = None) -> dict:
+        """
+        Play `n` games to completion from the current position, without altering the environment
+
+        :param policy: The policy for both players (see `playout`)
+        :param n: The number of games to play
+        :param seed: The seed of the random number generator
+        :return: The outcome statistics
+        """
+        assert not self.done, '[ERR: playout] The episode is done'
+        return playout(self.board, self.player, policy=policy, n=n, last_moves=list(self.last_moves),
+                       n_moves=self.n_moves, seed=seed, cache=self.cache)
+
+    def probe(self, tablebase: Tablebase) -> Optional[Tuple[int, int]]:
+        """
+        Look up the current position in the endgame tablebase
+
+        :param tablebase: The tablebase
+        :return: The result for the player to move and the number of plies to it, or None if not in the tablebase
+        """
+        return tablebase.probe(self.board, self.player)
+
     def render(self, mode: str = 'human'):
         """
         Render the current state of the scene